@@ -44,6 +44,8 @@
 # : calculate 125m grid square code from ucode
 # extract_latlong_from_ucode(ucode)
 # : extract geogphical location (latitude, longitude) from ucode
+# UcodeCache(capacity, precision)
+# : MeshcodeCache of worldmesh.py with ucode_to_meshcode(ucode, level), a cached calculation of a grid square code of level from ucode
 
 from worldmesh import *
 import math
@@ -223,3 +225,12 @@ def ucode_to_meshcode(ucode):
    ucode = ucode.lower()
    gp = extract_latlong_from_ucode(ucode)
    return cal_meshcode3(float(gp["latitude"]),float(gp["longitude"]))
+
+def _ucode_to_meshcode_level(ucode, level):
+   gp = extract_latlong_from_ucode(ucode)
+   return cal_meshcode_level(float(gp["latitude"]),float(gp["longitude"]),level)
+
+class UcodeCache(MeshcodeCache):
+   def ucode_to_meshcode(self, ucode, level=3):
+      ucode = ucode.lower()
+      return self._get(("ucode", ucode, level), _ucode_to_meshcode_level, ucode, level)
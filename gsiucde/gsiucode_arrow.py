@@ -0,0 +1,80 @@
+#
+# Python functions to calculate a place identification code based on ucode
+# on Apache Arrow arrays and Parquet files (requires pyarrow and
+# worldmesh_arrow.py).
+#
+# The calculations are done by pyarrow.compute kernels on whole arrays,
+# following the same steps as gsiucode.py. Null values and ucodes which
+# are not place identification codes give null results.
+#
+# latlong_to_ucode_arrow(latitudes, longitudes)
+# : convert arrays of geographic locations (latitude, longitude) into ucodes
+# extract_latlong_from_ucode_arrow(ucodes)
+# : extract the table of geogphical locations (latitude, longitude) from an array of ucodes
+# ucode_to_meshcode_arrow(ucodes, level)
+# : calculate grid square codes of level (1 to 12) from an array of ucodes
+# append_ucode_meshcode_parquet(source, where, ucode, level, name)
+# : copy the Parquet file source to where one row group at a time, appending the column name of grid square codes
+
+import pyarrow as pa
+import pyarrow.compute as pc
+from gsiucode import gsi16
+from worldmesh_arrow import cal_meshcode_arrow, _map_parquet_row_groups
+
+_HEX = pa.array(list("0123456789abcdef"))
+
+def _hex_to_uint64(ucodes, start):
+    # 16 hexadecimal digits from start
+    v = None
+    for k in range(16):
+        c = pc.utf8_slice_codeunits(ucodes, start+k, start+k+1)
+        d = pc.cast(pc.index_in(c, value_set=_HEX), pa.uint64())
+        if v is None:
+            v = d
+        else:
+            v = pc.add(pc.shift_left(v, 4), d)
+    return v
+
+def _bits(v, shift, count):
+    return pc.bit_wise_and(pc.shift_right(v, shift), (1 << count) - 1)
+
+def latlong_to_ucode_arrow(latitudes, longitudes):
+    latitude = pc.cast(latitudes, pa.float64())
+    longitude = pc.cast(longitudes, pa.float64())
+    valid = pc.and_(pc.and_(pc.greater_equal(latitude, -90.0), pc.less_equal(latitude, 90.0)),
+                    pc.and_(pc.greater_equal(longitude, -180.0), pc.less_equal(longitude, 180.0)))
+    latitude = pc.if_else(valid, latitude, 0.0)
+    longitude = pc.if_else(valid, longitude, 0.0)
+    lat2_f = pc.cast(pc.less(latitude, 0.0), pa.uint64())
+    long2_f = pc.cast(pc.less(longitude, 0.0), pa.uint64())
+    lat = pc.cast(pc.floor(pc.multiply(pc.multiply(pc.multiply(pc.abs(latitude), 60.0), 60.0), 10.0)), pa.uint64())
+    lng = pc.cast(pc.floor(pc.multiply(pc.multiply(pc.multiply(pc.abs(longitude), 60.0), 60.0), 10.0)), pa.uint64())
+    # lower 64 bits : class (2 bits), latitude (1+22 bits), longitude (1+23 bits), altitude and item (zero)
+    v = pc.bit_wise_or(pc.bit_wise_or(pc.shift_left(lat2_f, 61), pc.shift_left(lat, 39)),
+                       pc.bit_wise_or(pc.shift_left(long2_f, 38), pc.shift_left(lng, 15)))
+    digits = [pc.take(_HEX, pc.cast(_bits(v, 4*(15-k), 4), pa.int64())) for k in range(16)]
+    ucode = pc.binary_join_element_wise(gsi16, *(digits + [""]))
+    invalid = pc.and_(pc.invert(valid), pc.and_(pc.is_valid(latitudes), pc.is_valid(longitudes)))
+    return pc.if_else(invalid, "9"*32, ucode)
+
+def extract_latlong_from_ucode_arrow(ucodes):
+    ucodes = pc.utf8_lower(ucodes)
+    place = pc.equal(pc.utf8_slice_codeunits(ucodes, 0, 16), gsi16)
+    v = _hex_to_uint64(ucodes, 16)
+    lat = pc.multiply(pc.divide(pc.divide(pc.cast(_bits(v, 39, 22), pa.float64()), 60.0), 60.0), 0.1)
+    lng = pc.multiply(pc.divide(pc.divide(pc.cast(_bits(v, 15, 23), pa.float64()), 60.0), 60.0), 0.1)
+    lat = pc.if_else(pc.equal(_bits(v, 61, 1), 1), pc.negate(lat), lat)
+    lng = pc.if_else(pc.equal(_bits(v, 38, 1), 1), pc.negate(lng), lng)
+    null = pa.scalar(None, pa.float64())
+    return pa.table({"latitude":pc.if_else(place, lat, null), "longitude":pc.if_else(place, lng, null)})
+
+def ucode_to_meshcode_arrow(ucodes, level):
+    gp = extract_latlong_from_ucode_arrow(ucodes)
+    return cal_meshcode_arrow(gp["latitude"], gp["longitude"], level)
+
+def append_ucode_meshcode_parquet(source, where, ucode, level, name=None):
+    if name is None:
+        name = "meshcode%d" % level
+    def func(table):
+        return table.append_column(name, ucode_to_meshcode_arrow(table[ucode], level))
+    _map_parquet_row_groups(source, where, func)
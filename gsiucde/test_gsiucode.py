@@ -0,0 +1,66 @@
+#
+# Self-check of gsiucode_arrow.py against gsiucode.py (requires pyarrow).
+#
+# Run with "python test_gsiucode.py" or "python -m pytest" in this
+# directory; worldmesh.py is looked up in ../worldmesh.
+
+import os
+import random
+import sys
+import tempfile
+import unittest
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "worldmesh"))
+from gsiucode import *
+
+try:
+   import pyarrow as pa
+   import pyarrow.parquet as pq
+   import gsiucode_arrow
+except ImportError:
+   pa = None
+
+def random_positions(count, seed=0):
+   rand = random.Random(seed)
+   return [(rand.uniform(-89.9, 89.9), rand.uniform(-179.9, 179.9)) for i in range(count)]
+
+@unittest.skipIf(pa is None, "pyarrow is required")
+class TestArrow(unittest.TestCase):
+
+   def setUp(self):
+      positions = random_positions(1000) + [(35.681236, 139.767125), (0.0, 0.0), (-0.0001, -0.0001)]
+      self.latitudes = [latitude for latitude, longitude in positions]
+      self.longitudes = [longitude for latitude, longitude in positions]
+      self.ucodes = [latlong_to_ucode(latitude, longitude) for latitude, longitude in positions]
+
+   def test_latlong_to_ucode(self):
+      ucodes = gsiucode_arrow.latlong_to_ucode_arrow(pa.array(self.latitudes + [91.0, None]),
+                                                     pa.array(self.longitudes + [0.0, 0.0]))
+      self.assertEqual(ucodes.to_pylist(), self.ucodes + [latlong_to_ucode(91.0, 0.0), None])
+
+   def test_extract_latlong(self):
+      table = gsiucode_arrow.extract_latlong_from_ucode_arrow(pa.array(self.ucodes + ["0"*32, None]))
+      expected = [extract_latlong_from_ucode(ucode) for ucode in self.ucodes]
+      self.assertEqual(table["latitude"].to_pylist(), [gp["latitude"] for gp in expected] + [None, None])
+      self.assertEqual(table["longitude"].to_pylist(), [gp["longitude"] for gp in expected] + [None, None])
+
+   def test_ucode_to_meshcode(self):
+      ucodes = pa.array([ucode.upper() for ucode in self.ucodes])
+      for level in (1, 3, 6, 12):
+         expected = [cal_meshcode_level(gp["latitude"], gp["longitude"], level)
+                     for gp in (extract_latlong_from_ucode(ucode) for ucode in self.ucodes)]
+         self.assertEqual(gsiucode_arrow.ucode_to_meshcode_arrow(ucodes, level).to_pylist(), expected)
+      self.assertEqual([ucode_to_meshcode(ucode) for ucode in self.ucodes],
+                       gsiucode_arrow.ucode_to_meshcode_arrow(ucodes, 3).to_pylist())
+
+   def test_parquet(self):
+      with tempfile.TemporaryDirectory() as directory:
+         source = os.path.join(directory, "source.parquet")
+         where = os.path.join(directory, "where.parquet")
+         pq.write_table(pa.table({"ucode":self.ucodes + [None]}), source, row_group_size=400)
+         gsiucode_arrow.append_ucode_meshcode_parquet(source, where, "ucode", 4)
+         table = pq.read_table(where)
+      self.assertEqual(table["ucode"].to_pylist(), self.ucodes + [None])
+      self.assertEqual(table["meshcode4"].to_pylist(), [ucode_to_meshcode4(ucode) for ucode in self.ucodes] + [None])
+
+if __name__ == "__main__":
+   unittest.main()
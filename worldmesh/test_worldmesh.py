@@ -0,0 +1,463 @@
+#
+# Self-check of worldmesh.py. The expected codes and grid squares of the
+# levels 1 to 6 were calculated with Version 1.2, before the calculations
+# were driven by the level table. The finer levels 7 to 12 are checked by
+# round trips.
+#
+# Run with "python test_worldmesh.py" or "python -m pytest".
+
+import math
+import os
+import random
+import tempfile
+import unittest
+import worldmesh
+from worldmesh import *
+from worldmesh import _MESH_LENGTHS, _MESH_UNITS, _meshcode_to_index, _index_to_meshcode
+
+# position : codes of the levels 1 to 6
+KNOWN_CODES = [
+  ((35.681236, 139.767125), ['205339', '20533946', '2053394611', '20533946113', '205339461132', 2053394611323]),
+  ((-33.856784, 151.215297), ['605051', '60505161', '6050516127', '60505161273', '605051612733', 6050516127332]),
+  ((40.689247, -74.044502), ['306174', '30617400', '3061740023', '30617400234', '306174002341', 3061740023413]),
+  ((-22.951916, -43.210487), ['703443', '70344331', '7034433146', '70344331462', '703443314622', 7034433146223]),
+  ((51.500729, -0.124625), ['307700', '30770020', '3077002009', '30770020092', '307700200922', 3077002009222]),
+  ((0.0, 0.0), ['100000', '10000000', '1000000000', '10000000001', '100000000011', 1000000000111]),
+  ((-0.0001, -0.0001), ['700000', '70000000', '7000000000', '70000000001', '700000000011', 7000000000111]),
+  ((64.0, -150.0), ['409650', '40965000', '4096500000', '40965000001', '409650000011', 4096500000111]),
+]
+
+# grid square code : (lat0, long0, lat1, long1)
+KNOWN_GRIDS = [
+  ('205339', (36.0, 139.0, 35.33333333, 140.0)),
+  ('20533946', (35.75, 139.75, 35.66666667, 139.875)),
+  ('2053394611', (35.68333333, 139.7625, 35.675, 139.775)),
+  ('20533946114', (35.68333333, 139.76875, 35.67916667, 139.775)),
+  ('205339461143', (35.68333333, 139.76875, 35.68125, 139.771875)),
+  ('2053394611434', (35.68333333, 139.7703125, 35.68229167, 139.771875)),
+  ('8070335541', (-47.11666667, -133.65, -47.125, -133.6375)),
+]
+
+POSITIONS = [p for p, codes in KNOWN_CODES] + [(89.99, 179.99), (-89.99, -179.99), (12.3456789, -98.7654321)]
+
+class TestKnownCodes(unittest.TestCase):
+
+  def test_cal_meshcode(self):
+    functions = [cal_meshcode1, cal_meshcode2, cal_meshcode3, cal_meshcode4, cal_meshcode5, cal_meshcode6]
+    for (latitude, longitude), codes in KNOWN_CODES:
+      for func, code in zip(functions, codes):
+        self.assertEqual(func(latitude, longitude), code)
+      self.assertEqual(cal_meshcode(latitude, longitude), codes[2])
+
+  def test_out_of_range(self):
+    self.assertEqual(cal_meshcode3(91.0, 0.0), "9999999999")
+    self.assertEqual(cal_meshcode6(0.0, 181.0), "9999999999999")
+
+  def test_level_out_of_range(self):
+    for level in (0, 13):
+      self.assertRaises(ValueError, cal_meshcode_level, 35.0, 139.0, level)
+      self.assertRaises(ValueError, cal_meshcode_batch, [], [], level)
+      self.assertRaises(ValueError, MeshcodeSet, level)
+      self.assertRaises(ValueError, MeshTracker, level)
+      self.assertRaises(ValueError, meshcode_radius, 35.0, 139.0, 100.0, level)
+
+  def test_meshcode_to_latlong_grid(self):
+    for code, (lat0, long0, lat1, long1) in KNOWN_GRIDS:
+      self.assertEqual(meshcode_to_latlong_grid(code),
+                       {"lat0":lat0, "long0":long0, "lat1":lat1, "long1":long1})
+    self.assertEqual(meshcode_to_latlong_grid("1234567"),
+                     {"lat0":99999, "long0":99999, "lat1":99999, "long1":99999})
+    self.assertEqual(meshcode_to_latlong_grid("123"), None)
+
+class TestFineLevels(unittest.TestCase):
+
+  def test_round_trip(self):
+    for latitude, longitude in POSITIONS:
+      codes = [cal_meshcode_level(latitude, longitude, level) for level in range(1, 13)]
+      for level in range(7, 13):
+        code = codes[level-1]
+        self.assertEqual(len(code), _MESH_LENGTHS[level-1])
+        self.assertEqual(meshcode_level(code), level)
+        # each level refines the code of the level above
+        self.assertTrue(code.startswith(codes[level-2]))
+        self.assertEqual(meshcode_parent(code), codes[level-2])
+        self.assertIn(code, meshcode_children(codes[level-2]))
+        # the grid square contains the position and halves the one above
+        grid = meshcode_to_latlong_grid(code)
+        upper = meshcode_to_latlong_grid(codes[level-2])
+        self.assertTrue(grid["lat1"] - 1e-8 <= latitude <= grid["lat0"] + 1e-8)
+        self.assertTrue(grid["long0"] - 1e-8 <= longitude <= grid["long1"] + 1e-8)
+        self.assertAlmostEqual((grid["lat0"] - grid["lat1"])*2, upper["lat0"] - upper["lat1"], places=7)
+        self.assertAlmostEqual((grid["long1"] - grid["long0"])*2, upper["long1"] - upper["long0"], places=7)
+        # decoding and encoding the index gives back the code
+        self.assertEqual(_index_to_meshcode(level, *_meshcode_to_index(code, level)), code)
+
+  def test_index_round_trip(self):
+    for level in range(7, 13):
+      units = _MESH_UNITS[level-1]
+      for row in (0, 1, 135*units-1, 135*units, 270*units-1):
+        for col in (0, 1, 180*units-1, 180*units, 360*units-1):
+          code = _index_to_meshcode(level, row, col)
+          self.assertEqual(_meshcode_to_index(code, level), (row, col))
+
+def random_codes(count, seed=0):
+  rand = random.Random(seed)
+  return [cal_meshcode_level(rand.uniform(-89.99, 89.99), rand.uniform(-179.99, 179.99), rand.randint(1, 12)) for i in range(count)]
+
+def without_numpy(func, *args):
+  # result of func calculated code by code
+  saved = worldmesh.np
+  worldmesh.np = None
+  try:
+    return func(*args)
+  finally:
+    worldmesh.np = saved
+
+class TestBatch(unittest.TestCase):
+
+  def test_same_as_code_by_code(self):
+    codes = random_codes(3000) + ["1234567", "123", "113400", "813479"]
+    for data in (codes, [int(code) for code in codes]):
+      for func in (meshcode_to_latlong_grid_batch, meshcode_parent_batch, meshcode_neighbors_batch):
+        self.assertEqual(func(data), without_numpy(func, data))
+    grid = meshcode_to_latlong_grid_batch(["2053394610", "1234567", "123"])
+    self.assertEqual(grid["lat0"], [35.68333333, 99999, None])
+    self.assertEqual(grid["level"], [3, None, None])
+
+class TestArea(unittest.TestCase):
+
+  def test_globe(self):
+    # the grid squares of level 1 cover the globe once
+    codes = [_index_to_meshcode(1, row, col) for row in range(270) for col in range(360)]
+    surface = 4*math.pi*6371008.8**2
+    for func in (meshcode_area_batch, lambda codes: without_numpy(meshcode_area_batch, codes)):
+      self.assertAlmostEqual(sum(func(codes)["area"])/surface, 1.0, places=12)
+    self.assertAlmostEqual(sum(meshcode_area(code) for code in codes[::97])*97/surface, 1.0, places=2)
+
+  def test_invalid_codes(self):
+    codes = ["5339452211", "9999999999", "1234567", "2053394611"]
+    for func in (meshcode_area_batch, meshcode_size_batch):
+      for res in (func(codes), without_numpy(func, codes)):
+        self.assertEqual(res["level"], [None, None, None, 3])
+        for key, values in res.items():
+          self.assertEqual(values[0:3], [None]*3)
+    self.assertEqual(meshcode_area("5339452211"), None)
+    self.assertAlmostEqual(meshcode_area_batch(codes)["area"][3], meshcode_area("2053394611"))
+
+  def test_neighbor_distances(self):
+    for code in random_codes(300, seed=2):
+      neighbors = meshcode_neighbors(code)
+      north, east = neighbors[0], neighbors[2]
+      size = meshcode_size_batch([code])
+      if north is not None:
+        # along a meridian the distance is the height (up to the rounding of the centers
+        # of 1e-8 degree, about 1 mm)
+        self.assertAlmostEqual(meshcode_distance(code, north), size["height"][0], delta=0.003)
+      if abs(meshcode_to_latlong_center(code)["lat"]) < 80:
+        # along a parallel the great circle is a little shorter than the width
+        distance = meshcode_distance(code, east)
+        self.assertTrue(0.99*size["width"][0] < distance < size["width"][0] + 0.003, code)
+
+  def test_same_as_code_by_code(self):
+    codes = random_codes(3000) + ["1234567", "123", "5339452211"]
+    others = random_codes(3000, seed=3) + ["2053394611", "2053394611", "123"]
+    for data, other in ((codes, others), ([int(code) for code in codes], others)):
+      for func in (meshcode_area_batch, meshcode_centroid_batch, meshcode_size_batch):
+        res = func(data)
+        expected = without_numpy(func, data)
+        self.assertEqual(res["level"], expected["level"])
+        for key in res:
+          for value, value_expected in zip(res[key], expected[key]):
+            if value_expected is None:
+              self.assertEqual(value, None)
+            else:
+              self.assertAlmostEqual(value / value_expected, 1.0, places=12)
+      distances = meshcode_distance_batch(data, other)
+      self.assertEqual(distances[-3:-1], [None, None])
+      for value, a, b in zip(distances, data, other):
+        if value is not None and value > 1.0:
+          self.assertAlmostEqual(value / meshcode_distance(a, b), 1.0, places=9)
+    self.assertRaises(ValueError, meshcode_distance_batch, codes, others[1:])
+    self.assertRaises(ValueError, without_numpy, meshcode_distance_batch, codes, others[1:])
+
+class TestJoin(unittest.TestCase):
+
+  def setUp(self):
+    rand = random.Random(1)
+    # positions around Tokyo and targets of mixed levels, some nested in others
+    self.latitudes = [rand.uniform(35.5, 35.9) for i in range(2000)]
+    self.longitudes = [rand.uniform(139.5, 140.0) for i in range(2000)]
+    self.targets = []
+    for latitude, longitude in zip(self.latitudes[0:300], self.longitudes[0:300]):
+      self.targets.append(cal_meshcode_level(latitude, longitude, rand.choice([2, 3, 4, 6, 9, 12])))
+    self.targets.append("123")
+
+  def brute_force(self):
+    pairs = []
+    for i, (latitude, longitude) in enumerate(zip(self.latitudes, self.longitudes)):
+      for level in sorted(set(meshcode_level(code) for code in self.targets if meshcode_level(code))):
+        code = cal_meshcode_level(latitude, longitude, level)
+        if code in self.targets:
+          pairs.append((i, int(code)))
+    return pairs
+
+  def test_join(self):
+    expected = self.brute_force()
+    for func in (meshcode_join, lambda *args: without_numpy(meshcode_join, *args)):
+      res = func(self.latitudes, self.longitudes, self.targets)
+      self.assertEqual(list(zip(res["index"], res["meshcode"])), expected)
+
+  def test_join_chunks(self):
+    chunks = [(self.latitudes[k:k+700], self.longitudes[k:k+700]) for k in range(0, 2000, 700)]
+    pairs = []
+    for res in meshcode_join_chunks(chunks, self.targets):
+      pairs.extend(zip(res["index"], res["meshcode"]))
+    self.assertEqual(pairs, self.brute_force())
+
+  def test_contains_batch(self):
+    inside = set(i for i, code in self.brute_force())
+    expected = [i in inside for i in range(len(self.latitudes))]
+    self.assertEqual(meshcode_contains_batch(self.latitudes, self.longitudes, self.targets), expected)
+    self.assertEqual(without_numpy(meshcode_contains_batch, self.latitudes, self.longitudes, self.targets), expected)
+    self.assertEqual(meshcode_contains_batch([91.0], [0.0], self.targets), [False])
+
+class TestMeshcodeSet(unittest.TestCase):
+
+  def test_invalid_codes(self):
+    # area digit, digits out of their division, row and column out of range
+    for level, code in [(3, "9999999999"), (2, "10000090"), (4, "20533946115"), (1, "113500"), (1, "217999"), (3, "2053394a10")]:
+      self.assertRaises(ValueError, MeshcodeSet, level, [code])
+      self.assertEqual(MeshcodeSet(level).contains_batch([code]), [False])
+
+  def test_round_trip(self):
+    codes = sorted(set(cal_meshcode3(latitude, longitude) for latitude, longitude in POSITIONS))
+    s = MeshcodeSet(3, codes)
+    self.assertEqual(sorted(s.to_list()), codes)
+    self.assertEqual(MeshcodeSet.from_bytes(s.to_bytes()), s)
+
+def angle_to_grid(latitude, longitude, grid):
+  # angular distance (radian) from a position to the nearest point of a grid square
+  phi0 = math.radians(latitude)
+  lat_s, lat_n = math.radians(grid["lat1"]), math.radians(grid["lat0"])
+  def angle(phi, dlong):
+    a = math.sin((phi-phi0)/2)**2 + math.cos(phi0)*math.cos(phi)*math.sin(dlong/2)**2
+    return 2*math.asin(min(1.0, math.sqrt(a)))
+  dlongs = []
+  for edge in (grid["long0"], grid["long1"]):
+    dlongs.append(math.radians((edge - longitude + 180) % 360 - 180))
+  if (longitude - grid["long0"]) % 360 <= grid["long1"] - grid["long0"]:
+    # nearest point on the meridian of the position
+    return angle(min(max(phi0, lat_s), lat_n), 0.0)
+  res = []
+  for dlong in dlongs:
+    # nearest point of the meridian of the edge, limited to the edge
+    if math.cos(dlong) > 0:
+      phi = math.atan(math.tan(phi0) / math.cos(dlong))
+    else:
+      phi = math.copysign(math.pi/2, phi0)
+    res.append(angle(min(max(phi, lat_s), lat_n), dlong))
+  return min(res)
+
+class TestRadius(unittest.TestCase):
+
+  def brute_force(self, latitude, longitude, radius, level, centroid):
+    # grid squares of level around the circle, and those within a relative
+    # margin of 1e-9 of the radius which may go either way
+    d = min(radius / 6371008.8, math.pi)
+    units = _MESH_UNITS[level-1]
+    inside, boundary = set(), set()
+    for row in range(270*units):
+      for col in range(360*units):
+        code = _index_to_meshcode(level, row, col)
+        if centroid:
+          center = meshcode_to_latlong_center(code)
+          r = angle_to_grid(latitude, longitude, {"lat0":center["lat"], "lat1":center["lat"],
+                                                  "long0":center["long"], "long1":center["long"]})
+        else:
+          r = angle_to_grid(latitude, longitude, meshcode_to_latlong_grid(code))
+        if r < d*(1 - 1e-9):
+          inside.add(code)
+        elif r <= d*(1 + 1e-9) + 1e-12:
+          boundary.add(code)
+    return inside, boundary
+
+  def check(self, latitude, longitude, radius, level, centroid):
+    codes = meshcode_radius(latitude, longitude, radius, level, centroid)
+    self.assertEqual(len(codes), len(set(codes)))
+    inside, boundary = self.brute_force(latitude, longitude, radius, level, centroid)
+    self.assertTrue(inside <= set(codes), (latitude, longitude, radius, level, centroid, inside - set(codes)))
+    self.assertTrue(set(codes) <= inside | boundary, (latitude, longitude, radius, level, centroid, set(codes) - inside))
+
+  def test_brute_force(self):
+    rand = random.Random(7)
+    cases = [(35.0, 139.0, 2.5e7, 1), (89.5, 10.0, 300000.0, 1), (-89.9, 0.0, 50000.0, 1),
+             (10.0, 179.9, 400000.0, 1), (0.0, 0.0, 0.0, 1), (60.0001, 10.0001, 0.0, 2)]
+    for i in range(12):
+      level = rand.choice([1, 2])
+      cases.append((rand.uniform(-89.9, 89.9), rand.uniform(-180.0, 180.0), rand.choice([1.0, 20000.0, 150000.0, 900000.0]), level))
+    for latitude, longitude, radius, level in cases:
+      for centroid in (False, True):
+        self.check(latitude, longitude, radius, level, centroid)
+
+  def test_tiny_radius(self):
+    for latitude, longitude in POSITIONS + [(60.0001, 10.0001)]:
+      for level in (3, 6, 12):
+        code = cal_meshcode_level(latitude, longitude, level)
+        self.assertIn(code, meshcode_radius(latitude, longitude, 0.0, level))
+        self.assertIn(code, meshcode_radius(latitude, longitude, 1e-6, level))
+
+  def test_batch(self):
+    rand = random.Random(8)
+    latitudes = [rand.uniform(-89.9, 89.9) for i in range(50)] + [91.0]
+    longitudes = [rand.uniform(-180.0, 180.0) for i in range(50)] + [0.0]
+    radii = [rand.uniform(0.0, 5000.0) for i in range(51)]
+    for centroid in (False, True):
+      self.assertEqual(meshcode_radius_batch(latitudes, longitudes, radii, 3, centroid),
+                       [meshcode_radius(a, b, r, 3, centroid) for a, b, r in zip(latitudes, longitudes, radii)])
+      self.assertEqual(meshcode_radius_batch(latitudes, longitudes, 3000.0, 4, centroid),
+                       [meshcode_radius(a, b, 3000.0, 4, centroid) for a, b in zip(latitudes, longitudes)])
+    self.assertEqual(meshcode_radius_batch(latitudes, longitudes, radii, 3)[-1], None)
+
+class TestMeshTracker(unittest.TestCase):
+
+  def track(self, count, seed):
+    # random walk of count fixes, one per second
+    rand = random.Random(seed)
+    latitude, longitude = 35.6, 139.7
+    fixes = []
+    for t in range(count):
+      latitude += rand.uniform(-0.002, 0.002)
+      longitude += rand.uniform(-0.002, 0.002)
+      fixes.append((float(t), latitude, longitude))
+    return fixes
+
+  def test_same_as_naive(self):
+    fixes = self.track(5000, 5)
+    for level in (3, 5, 8):
+      expected = []
+      current = None
+      for t, latitude, longitude in fixes:
+        code = cal_meshcode_level(latitude, longitude, level)
+        if code != current:
+          if current is not None:
+            expected.append({"object_id":"a", "t":t, "event":"exit", "meshcode":current})
+          expected.append({"object_id":"a", "t":t, "event":"enter", "meshcode":code})
+          current = code
+      tracker = MeshTracker(level)
+      events = tracker.update_batch(["a"]*len(fixes), *zip(*fixes))
+      self.assertEqual(events, expected)
+      self.assertEqual(tracker.current("a"), current)
+
+  def test_interpolate(self):
+    # every 50th fix of the walk, crossing several grid squares between fixes
+    fixes = self.track(5000, 6)[::50]
+    tracker = MeshTracker(5, interpolate=True)
+    events = tracker.update_batch(["a"]*len(fixes), *zip(*fixes))
+    self.assertEqual(events[0]["event"], "enter")
+    current = events[0]["meshcode"]
+    t = fixes[0][0]
+    for exit, enter in zip(events[1::2], events[2::2]):
+      self.assertEqual((exit["event"], enter["event"]), ("exit", "enter"))
+      self.assertEqual(exit["meshcode"], current)
+      self.assertEqual(exit["t"], enter["t"])
+      self.assertTrue(t <= enter["t"])
+      # each crossing leads to an adjacent grid square
+      self.assertIn(enter["meshcode"], meshcode_neighbors(current))
+      current = enter["meshcode"]
+      t = enter["t"]
+    self.assertEqual(current, cal_meshcode_level(fixes[-1][1], fixes[-1][2], 5))
+    self.assertEqual(tracker.current("a"), current)
+
+  def test_across_180(self):
+    for interpolate in (False, True):
+      tracker = MeshTracker(3, interpolate)
+      west = cal_meshcode3(10.0, 179.999)
+      east = cal_meshcode3(10.0, -179.999)
+      self.assertEqual([e["meshcode"] for e in tracker.update("a", 0.0, 10.0, 179.999)], [west])
+      events = tracker.update("a", 1.0, 10.0, -179.999)
+      self.assertEqual([(e["event"], e["meshcode"]) for e in events], [("exit", west), ("enter", east)])
+      if interpolate:
+        self.assertAlmostEqual(events[0]["t"], 0.5)
+
+  def test_out_of_range(self):
+    for interpolate in (False, True):
+      tracker = MeshTracker(3, interpolate)
+      code = cal_meshcode3(89.99, 0.0)
+      tracker.update("a", 0.0, 89.99, 0.0)
+      self.assertEqual(tracker.update("a", 1.0, 91.0, 0.0),
+                       [{"object_id":"a", "t":1.0, "event":"exit", "meshcode":code}])
+      self.assertEqual(tracker.current("a"), None)
+      self.assertEqual(tracker.update("a", 2.0, 91.0, 0.0), [])
+      self.assertEqual(tracker.update("a", 3.0, 89.99, 0.0),
+                       [{"object_id":"a", "t":3.0, "event":"enter", "meshcode":code}])
+
+try:
+  import pandas as pd
+  import pyarrow as pa
+  import pyarrow.parquet as pq
+  import worldmesh_arrow
+  import worldmesh_pandas
+except ImportError:
+  pd = None
+
+@unittest.skipIf(pd is None, "pandas and pyarrow are required")
+class TestVectorized(unittest.TestCase):
+
+  def test_same_as_python(self):
+    rand = random.Random(0)
+    for level in range(1, 13):
+      codes = [cal_meshcode_level(rand.uniform(-89.9, 89.9), rand.uniform(-179.9, 179.9), level) for i in range(2000)]
+      grid = meshcode_to_latlong_grid_batch(codes)
+      center = meshcode_centroid_batch(codes)
+      table = worldmesh_arrow.meshcode_to_latlong_grid_arrow(pa.array(codes))
+      series = pd.Series(codes, dtype="meshcode")
+      bounds = series.meshcode.bounds()
+      for key in ("lat0", "long0", "lat1", "long1"):
+        self.assertEqual(table[key].to_pylist(), grid[key])
+        self.assertEqual(bounds[key].tolist(), grid[key])
+      self.assertEqual(series.meshcode.center()["lat"].tolist(), center["lat"])
+      self.assertEqual(series.meshcode.center()["long"].tolist(), center["long"])
+      area = meshcode_area_batch(codes)["area"]
+      size = meshcode_size_batch(codes)
+      self.assertEqual(series.meshcode.area().tolist(), area)
+      self.assertEqual(series.meshcode.size()["width"].tolist(), size["width"])
+      self.assertEqual(series.meshcode.size()["height"].tolist(), size["height"])
+      other = list(reversed(codes))
+      self.assertEqual(series.meshcode.distance(pd.Series(other, dtype="meshcode")).tolist(),
+                       meshcode_distance_batch(codes, other))
+
+  def test_unknown_lengths(self):
+    codes = ["2053394611", "1234567", "123456789", "123", None]
+    grid = meshcode_to_latlong_grid_batch(codes[0:4])
+    table = worldmesh_arrow.meshcode_to_latlong_grid_arrow(pa.array(codes))
+    bounds = pd.Series(codes, dtype="meshcode").meshcode.bounds()
+    for key in ("lat0", "long0", "lat1", "long1"):
+      self.assertEqual(grid[key][1:4], [99999, 99999, None])
+      self.assertEqual(table[key].to_pylist(), grid[key] + [None])
+      self.assertEqual(bounds[key].tolist()[0:3], grid[key][0:3])
+      self.assertEqual(bounds[key].isna().tolist()[3:5], [True, True])
+    self.assertEqual(table["level"].to_pylist(), [3, None, None, None, None])
+
+  def test_parquet(self):
+    rand = random.Random(4)
+    latitudes = [rand.uniform(-89.9, 89.9) for i in range(1000)] + [None, 91.0]
+    longitudes = [rand.uniform(-179.9, 179.9) for i in range(1000)] + [0.0, 0.0]
+    with tempfile.TemporaryDirectory() as directory:
+      source = os.path.join(directory, "source.parquet")
+      coded = os.path.join(directory, "coded.parquet")
+      gridded = os.path.join(directory, "gridded.parquet")
+      pq.write_table(pa.table({"id":list(range(1002)), "lat":latitudes, "lon":longitudes}), source, row_group_size=300)
+      worldmesh_arrow.append_meshcode_parquet(source, coded, "lat", "lon", 4)
+      worldmesh_arrow.append_latlong_grid_parquet(coded, gridded, "meshcode4")
+      self.assertEqual(pq.ParquetFile(gridded).num_row_groups, 4)
+      table = pq.read_table(gridded)
+    self.assertEqual(table["id"].to_pylist(), list(range(1002)))
+    codes = [cal_meshcode4(latitude, longitude) for latitude, longitude in zip(latitudes[0:1000], longitudes[0:1000])]
+    self.assertEqual(table["meshcode4"].to_pylist(), codes + [None, "99999999999"])
+    grid = meshcode_to_latlong_grid_batch(codes)
+    for key in ("lat0", "long0", "lat1", "long1", "level"):
+      self.assertEqual(table[key].to_pylist()[0:1000], grid[key])
+      self.assertEqual(table[key].to_pylist()[1000], None)
+
+if __name__ == "__main__":
+  unittest.main()
@@ -26,9 +26,10 @@
 # Difference from Version 1.0
 # Debugging for cal_meshcode5() and cal_meshcode6()
 #
-# Two types of functions are defined in this library.
+# Three types of functions are defined in this library.
 # 1. calculate representative geographical position(s) (latitude, longitude) of a grid square from a grid square code
 # 2. calculate a grid square code from a geographical position (latitude, longitude)
+# 3. batch and hierarchy operations on lists of grid square codes
 #
 # 1.
 #
@@ -44,6 +45,8 @@
 # : calculate sourthern eastern geographic position of the grid (latitude, longitude) from meshcode
 # meshcode_to_latlong_grid(meshcode)
 # : calculate northern western and sourthern eastern geographic positions of the grid (latitude0, longitude0, latitude1, longitude1) from meshcode
+# meshcode_to_latlong_center(meshcode)
+# : calculate the central geographic position of the grid (latitude, longitude) from meshcode
 # cal_meshcode(latitude,longitude)
 #
 # 2.
@@ -61,6 +64,86 @@
 # : calculate a 250m grid square code (12 digits) from a geographical position (latitude, longitude)
 # cal_meshcode6(latitude,longitude)
 # : calculate a 125m grid square code (13 digits) from a geographical position (latitude, longitude)
+# cal_meshcode_level(latitude,longitude,level)
+# : calculate a grid square code of level (1 to 12) from a geographical position (latitude, longitude)
+# cal_meshcode_batch(latitudes,longitudes,level)
+# : calculate grid square codes of level (1 to 12) for lists of latitudes and longitudes
+#
+# 3.
+#
+# meshcode_level(meshcode)
+# : return the level (1 to 12) of a grid square code, or None for an unknown length
+# meshcode_parent(meshcode, level)
+# : calculate the upper grid square code of meshcode at level (one level up by default)
+# meshcode_children(meshcode)
+# : calculate the grid square codes one level below meshcode
+# meshcode_neighbors(meshcode)
+# : calculate the eight adjacent grid square codes (N, NE, E, SE, S, SW, W, NW) of the same level
+# meshcode_to_latlong_grid_batch(meshcodes)
+# : meshcode_to_latlong_grid() for a list of grid square codes of mixed levels
+# meshcode_parent_batch(meshcodes, level)
+# : meshcode_parent() for a list of grid square codes of mixed levels
+# meshcode_neighbors_batch(meshcodes)
+# : meshcode_neighbors() for a list of grid square codes of mixed levels
+# meshcode_join(latitudes, longitudes, meshcodes)
+# : find the positions lying in the grid squares of meshcodes (mixed levels), returning the arrays (array("q"))
+#   "index" of the positions and "meshcode" of the grid squares (as integers), sorted by index
+# meshcode_join_chunks(chunks, meshcodes)
+# : meshcode_join() for an iterable of (latitudes, longitudes) chunks, yielding the result of each chunk
+# meshcode_contains_batch(latitudes, longitudes, meshcodes)
+# : check whether each position lies in any of the grid squares of meshcodes
+# meshcode_area(meshcode)
+# : calculate the ground area (m^2) of a grid square (None for an invalid code)
+# meshcode_distance(meshcode0, meshcode1)
+# : calculate the distance (m) between the centers of two grid squares
+# meshcode_area_batch(meshcodes)
+# : meshcode_area() for a list of grid square codes of mixed levels
+# meshcode_centroid_batch(meshcodes)
+# : meshcode_to_latlong_center() for a list of grid square codes of mixed levels
+# meshcode_size_batch(meshcodes)
+# : calculate the width and height (m) at the center of grid squares for a list of grid square codes of mixed levels
+# meshcode_distance_batch(meshcodes0, meshcodes1)
+# : meshcode_distance() for two lists of the same length of grid square codes of mixed levels
+#
+# meshcode_radius(latitude, longitude, radius, level, centroid)
+# : calculate the grid square codes of level intersecting the circle of radius (m) around (latitude, longitude)
+#   (with centroid=True, the grid squares whose centers lie in the circle)
+# meshcode_radius_batch(latitudes, longitudes, radius, level, centroid)
+# : meshcode_radius() for lists of latitudes and longitudes (radius may be a list)
+# MeshcodeSet(level, meshcodes)
+# : compressed set of grid square codes of level
+#   add_batch(meshcodes), contains_batch(meshcodes), len(), in
+#   union(other) (|), intersection(other) (&), difference(other) (-)
+#   to_list(), to_bytes(), MeshcodeSet.from_bytes(data)
+# MeshcodeCache(capacity, precision)
+# : size-bounded (least recently used) cache of grid square calculations, safe to share between threads
+#   meshcode_to_latlong_grid(meshcode), cal_meshcode(latitude, longitude, level)
+#   : cached versions; positions are rounded to precision decimal places before the calculation
+#   warm(meshcodes), stats(), clear()
+#   : pre-calculate meshcode_to_latlong_grid() for meshcodes, hit/miss statistics, empty the cache
+# MeshTracker(level, interpolate)
+# : tracker of the grid squares of moving objects, reporting when an object enters or exits a grid square
+#   update(object_id, t, latitude, longitude), update_batch(object_ids, ts, latitudes, longitudes)
+#   : process fixes and return the list of events {"object_id", "t", "event" ("enter" or "exit"), "meshcode"}
+#   current(object_id)
+#   : grid square code of the current position of object_id
+#
+# Areas and distances are calculated on a sphere of radius 6371008.8 m (mean radius of the earth).
+# The batch functions give None for the area and size of an invalid code
+# (meshcode_area_batch, meshcode_size_batch) as meshcode_area() does. On
+# numpy arrays, they may differ from the functions of a single code in the
+# last bits of the floating point numbers.
+#
+# The batch functions accept codes of mixed levels, the level of each code
+# being given by its length, and return the results in the original order
+# as lists, together with a list "level" holding the level of each code
+# (None for an unknown length). When numpy is installed, the codes are
+# grouped by level and every group is calculated at once on numpy arrays;
+# otherwise (or when a code is neither an integer nor a string of digits)
+# they are calculated one by one. meshcode_parent_batch() always works code
+# by code, as slicing the codes is faster than converting them to numpy.
+#
+# A level argument out of 1 to 12 raises ValueError.
 #
 # Structure of the world grid square code with compatibility to JIS X0410
 # A : area code (1 digit) A takes 1 to 8
@@ -70,8 +153,22 @@
 # ABBBBBCCDDE : 500m grid square code (15 arc-seconds for latitude, 22.5 arc-seconds for longitude) (11 digits)
 # ABBBBBCCDDEF : 250m grid square code (7.5 arc-seconds for latitude, 11.25 arc-seconds for longitude) (12 digits)
 # ABBBBBCCDDEFG : 125m grid square code (3.75 arc-seconds for latitude, 5.625 arc-seconds for longitude) (13 digits)
+# ABBBBBCCDDEFGH : 62.5m grid square code (1.875 arc-seconds for latitude, 2.8125 arc-seconds for longitude) (14 digits)
+# ...
+# Each further digit divides the grid square into quadrants, up to the 12th level (19 digits, about 2m).
 
 import math
+import numbers
+import struct
+import sys
+import threading
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 def meshcode_to_latlong(meshcode):
     res=meshcode_to_latlong_grid(meshcode)
@@ -100,192 +197,14 @@ def meshcode_to_latlong_SE(meshcode):
 
 def meshcode_to_latlong_grid(meshcode):
     code=str(meshcode)
-    # more than 1st grid
-    if len(code)>=6 :
-        code0=int(code[0:1])-1
-        code12=code[1:4]
-        if code12[0:1]=="00":
-            code12=int(code[3:4])
-        else:
-            if code12[0:2]=="0":
-                code12=int(code[2:4])
-            else:
-                code12=int(code[1:4])
-        if code[4:5]=="0":
-            code34=int(code[5:6])
-        else:
-            code34=int(code[4:6])
-        lat_width=2.0/3.0
-        long_width=1.0
-    else: return None
-
-    # more than 2nd grid
-    if len(code)>=8:
-        code5=int(code[6:7])
-        code6=int(code[7:8])
-        lat_width=lat_width/8.0
-        long_width=long_width/8.0
-    # more than 3rd grid
-    if len(code)>=10:
-        code7=int(code[8:9])
-        code8=int(code[9:10])
-        lat_width=lat_width/10.0
-        long_width=long_width/10.0
-    # more than 4th grid
-    if len(code)>=11:
-        code9=int(code[10:11])
-        lat_width=lat_width/20.0
-        long_width=long_width/20.0
-    # morethan 5th grid
-    if len(code)>=12:
-        code10=int(code[11:12])
-        lat_width=lat_width/40.0
-        long_width=long_width/40.0
-    # more than 6th grid
-    if len(code)>=13:
-        code11=int(code[12:13])
-        lat_width=lat_width/80.0
-        long_width=long_width/80.0
-
-    # 0'th grid
-    z = code0 % 2
-    y = ((code0-z)/2) % 2
-    x = (code0-2*y-z)/4
-
-    # 1st grid
-    if len(code)==6:
-        lat0  = (code12-x+1) * 2.0 / 3.0
-        long0 = (code34+y) + 100*z
-        lat0  = (1-2*x)*lat0
-        long0 = (1-2*y)*long0
-        dlat = 2.0/3.0
-        dlong = 1.0
-        lat1  = "%.8f" % (lat0-dlat)
-        long1 = "%.8f" % (long0+dlong)
-        lat0  = "%.8f" % lat0
-        long0 = "%.8f" % long0
-        xx = {"lat0":float(lat0), "long0":float(long0), "lat1":float(lat1), "long1":float(long1)}
-        return xx
-    # 2nd grid
-    elif len(code)==8:
-        lat0  = code12 * 2.0 / 3.0
-        long0 = code34 + 100*z
-        lat0  = lat0  + ((code5-x+1) * 2.0 / 3.0) / 8.0
-        long0 = long0 +  (code6+y) / 8.0
-        lat0 = (1-2*x) * lat0
-        long0 = (1-2*y) * long0
-        dlat = 2.0/3.0/8.0
-        dlong = 1.0/8.0
-        lat1  = "%.8f" % (lat0-dlat)
-        long1 = "%.8f" % (long0+dlong)
-        lat0  = "%.8f" % lat0
-        long0 = "%.8f" % long0
-        xx = {"lat0":float(lat0), "long0":float(long0), "lat1":float(lat1), "long1":float(long1)}
-        return xx
-     # 3rd grid
-    elif len(code)==10:
-         lat0  = code12 * 2.0 / 3.0
-         long0 = code34 + 100*z
-         lat0  = lat0  + (code5 * 2.0 / 3.0) / 8.0
-         long0 = long0 +  code6 / 8.0
-         lat0  = lat0  + ((code7-x+1) * 2.0 / 3.0) / 8.0 / 10.0
-         long0 = long0 +  (code8+y) / 8.0 / 10.0
-         lat0 = (1-2*x)*lat0
-         long0 = (1-2*y)*long0
-         dlat = 2.0/3.0/8.0/10.0
-         dlong = 1/8.0/10.0
-         lat1  = "%.8f" % (lat0-dlat)
-         long1 = "%.8f" % (long0+dlong)
-         lat0  = "%.8f" % (lat0)
-         long0 = "%.8f" % (long0)
-         xx = {"lat0":float(lat0), "long0":float(long0), "lat1":float(lat1), "long1":float(long1)}
-         return xx
-     # code 9
-     #     N
-     #   3 | 4
-     # W - + - E
-     #   1 | 2
-     #     S
-     # 4th frid (11 digits)
-    elif len(code)==11:
-         lat0  = code12 * 2.0 / 3.0
-         long0 = code34 + 100*z
-         lat0  = lat0  + (code5 * 2.0 / 3.0) / 8.0
-         long0 = long0 +  code6 / 8.0
-         lat0  = lat0  + ((code7-x+1) * 2.0 / 3.0) / 8.0 / 10.0
-         long0 = long0 +  (code8+y) / 8.0 / 10.0
-         lat0  = lat0  + (math.floor((code9-1)/2)+x-1) * 2.0 / 3.0 / 8.0 / 10.0 / 2.0
-         long0 = long0 + ((code9-1)%2-y) / 8.0 / 10.0 / 2.0
-         lat0 = (1-2*x)*lat0
-         long0 = (1-2*y)*long0
-         dlat = 2.0/3.0/8.0/10.0/2.0
-         dlong = 1.0/8.0/10.0/2.0
-         lat1  = "%.8f" % (lat0-dlat)
-         long1 = "%.8f" % (long0+dlong)
-         lat0  = "%.8f" % lat0
-         long0 = "%.8f" % long0
-         xx = {"lat0":float(lat0), "long0":float(long0), "lat1":float(lat1), "long1":float(long1)}
-         return xx
-    # code 10
-    #     N
-    #   3 | 4
-    # W - + - E
-    #   1 | 2
-    #     S
-    # 5th grid (12 digits)
-    elif len(code)==12:
-        lat0  = code12 * 2.0 / 3.0
-        long0 = code34 + 100*z
-        lat0  = lat0  + (code5 * 2.0 / 3.0) / 8.0
-        long0 = long0 +  code6 / 8.0
-        lat0  = lat0  + ((code7-x+1) * 2.0 / 3.0) / 8.0 / 10.0
-        long0 = long0 +  (code8+y) / 8.0 / 10.0
-        lat0  = lat0  + (math.floor((code9-1)/2)+x-1) * 2.0 / 3.0 / 8.0 / 10.0 / 2.0
-        long0 = long0 + ((code9-1)%2-y) / 8.0 / 10.0 / 2.0
-        lat0  = lat0  + (math.floor((code10-1)/2)+x-1) * 2.0 / 3.0 / 8.0 / 10.0 / 2.0 / 2.0
-        long0 = long0 + ((code10-1)%2-y) / 8.0 / 10.0 / 2.0 / 2.0
-        lat0 = (1-2*x)*lat0
-        long0 = (1-2*y)*long0
-        dlat = 2.0/3.0/8.0/10.0/2.0/2.0
-        dlong = 1.0/8.0/10.0/2.0/2.0
-        lat1  = "%.8f" % (lat0-dlat)
-        long1 = "%.8f" % (long0+dlong)
-        lat0  = "%.8f" % (lat0)
-        long0 = "%.8f" % (long0)
-        xx = {"lat0":float(lat0), "long0":float(long0), "lat1":float(lat1), "long1":float(long1)}
+    if len(code) < 6:
+        return None
+    level = _MESH_LEVELS.get(len(code))
+    if level is None:
+        xx = {"lat0":int("99999"), "long0":int("99999"), "lat1":int("99999"), "long1":int("99999")}
         return xx
-    # code 11
-    #     N
-    #   3 | 4
-    # W - + - E
-    #   1 | 2
-    #     S
-    # 6rd grid (13 digits)
-    elif len(code)==13:
-        lat0  = code12 * 2.0 / 3.0
-        long0 = code34 + 100*z
-        lat0  = lat0  + (code5 * 2.0 / 3.0) / 8.0
-        long0 = long0 +  code6 / 8.0
-        lat0  = lat0  + ((code7-x+1) * 2.0 / 3.0) / 8.0 / 10.0
-        long0 = long0 +  (code8+y) / 8.0 / 10.0
-        lat0  = lat0  + (math.floor((code9-1)/2)+x-1) * 2.0 / 3.0 / 8.0 / 10.0 / 2.0
-        long0 = long0 + ((code9-1)%2-y) / 8.0 / 10.0 / 2.0
-        lat0  = lat0  + (math.floor((code10-1)/2)+x-1) * 2.0 / 3.0 / 8.0 / 10.0 / 2.0 / 2.0
-        long0 = long0 + ((code10-1)%2-y) / 8.0 / 10.0 / 2.0 / 2.0
-        lat0  = lat0  + (math.floor((code11-1)/2)+x-1) * 2.0 / 3.0 / 8.0 / 10.0 / 2.0 / 2.0 / 2.0
-        long0 = long0 + ((code11-1)%2-y) / 8.0 / 10.0 / 2.0 / 2.0 / 2.0
-        lat0 = (1-2*x)*lat0
-        long0 = (1-2*y)*long0
-        dlat = 2.0/3.0/8.0/10.0/2.0/2.0/2.0
-        dlong = 1.0/8.0/10.0/2.0/2.0/2.0
-        lat1  = "%.8f" % (lat0-dlat)
-        long1 = "%.8f" % (long0+dlong)
-        lat0  = "%.8f" % lat0
-        long0 = "%.8f" % long0
-        xx = {"lat0":float(lat0), "long0":float(long0), "lat1":float(lat1), "long1":float(long1)}
-        return xx
-
-    xx = {"lat0":int("99999"), "long0":int("99999"), "lat1":int("99999"), "long1":int("99999")}
+    lat0, long0, lat1, long1 = _index_to_grid(level, *_meshcode_to_index(code, level))
+    xx = {"lat0":lat0, "long0":long0, "lat1":lat1, "long1":long1}
     return xx
 
 # calculate 3rd mesh code
@@ -294,367 +213,1301 @@ def cal_meshcode(latitude, longitude):
 
 # calculate 1st mesh code
 def cal_meshcode1(latitude, longitude):
-  if latitude < -90 or latitude > 90 or longitude < -180 or longitude > 180:
-    return "999999"
-  if latitude < 0:
-    o = 4
-  else:
-    o = 0
-  if longitude < 0:
-    o = o + 2
-  if abs(longitude) >= 100:
-    o = o + 1
-  z = o % 2
-  y = ((o - z)/2) % 2
-  x = (o - 2*y - z)/4
-#
-  o = o + 1
-#
-  latitude = (1-2*x)*latitude
-  longitude = (1-2*y)*longitude
-  #
-  p = math.floor(latitude*60/40)
-  u = math.floor(longitude-100*z)
-  #
-  o = int(o)
-  p = int(p)
-  u = int(u)
-  #
-  if u < 10:
-    if p < 10:
-      mesh = str(o)+"00"+str(p)+"0"+str(u)
-    else:
-      if p < 100:
-       mesh = str(o)+"0"+str(p)+"0"+str(u)
-      else:
-       mesh = str(o)+str(p)+"0"+str(u)
-  else:
-    if p < 10:
-      mesh = str(o)+"00"+str(p)+str(u)
-    else:
-      if p < 100:
-          mesh = str(o)+"0"+str(p)+str(u)
-      else:
-        mesh = str(o)+str(p)+str(u)
-  return mesh
+  return cal_meshcode_level(latitude, longitude, 1)
 
 # calculate 2nd mesh code
 def cal_meshcode2(latitude, longitude):
- if latitude < -90 or latitude > 90 or longitude < -180 or longitude > 180:
-   return "99999999"
- if latitude < 0:
-    o = 4
- else:
-    o = 0
- if longitude < 0:
-    o = o + 2
- if abs(longitude) >= 100: o = o + 1
- z = o % 2
- y = ((o - z)/2) % 2
- x = (o - 2*y - z)/4
-#
- o = o + 1
-#
- latitude = (1-2*x)*latitude
- longitude = (1-2*y)*longitude
-#
- p = math.floor(latitude*60/40)
- a = (latitude*60/40-p)*40
- q = math.floor(a/5)
- u = math.floor(longitude-100*z)
- f = longitude-100*z-u
- v = math.floor(f*60/7.5)
- #
- o = int(o)
- p = int(p)
- u = int(u)
- q = int(q)
- v = int(v)
- #
- if u < 10:
-    if p < 10:
-      mesh = str(o)+"00"+str(p)+"0"+str(u)+str(q)+str(v)
-    else:
-      if p < 100:
-        mesh = str(o)+"0"+str(p)+"0"+str(u)+str(q)+str(v)
-      else:
-        mesh = str(o)+str(p)+"0"+str(u)+str(q)+str(v)
- else:
-    if p < 10:
-      mesh =str(o)+"00"+str(p)+str(u)+str(q)+str(v)
-    else:
-      if p < 100:
-        mesh = str(o)+"0"+str(p)+str(u)+str(q)+str(v)
-      else:
-        mesh = str(o)+str(p)+str(u)+str(q)+str(v)
- return mesh
+  return cal_meshcode_level(latitude, longitude, 2)
 
 # calculate 3rd mesh code
 def cal_meshcode3(latitude, longitude):
-  if latitude < -90 or latitude > 90 or longitude < -180 or longitude > 180:
-    return "9999999999"
-  if latitude < 0:
-    o = 4
-  else:
-    o = 0
-  if longitude < 0:
-    o = o + 2
-  if abs(longitude) >= 100:
-      o = o + 1
-  z = o % 2
-  y = ((o - z)/2) % 2
-  x = (o - 2*y - z)/4
-#
-  o = o + 1
-#
-  latitude = (1-2*x)*latitude
-  longitude = (1-2*y)*longitude
-  #
-  p = math.floor(latitude*60/40)
-  a = (latitude*60/40-p)*40
-  q = math.floor(a/5)
-  b = (a/5-q)*5
-  r = math.floor(b*60/30)
-  c = (b*60/30-r)*30
-  u = math.floor(longitude-100*z)
-  f = longitude-100*z-u
-  v = math.floor(f*60/7.5)
-  g = (f*60/7.5-v)*7.5
-  w = math.floor(g*60/45)
-  h = (g*60/45-w)*45
-  #
-  o = int(o)
-  p = int(p)
-  u = int(u)
-  q = int(q)
-  v = int(v)
-  r = int(r)
-  w = int(w)
-  #
-  if u < 10:
-    if p < 10:
-      mesh = str(o)+"00"+str(p)+"0"+str(u)+str(q)+str(v)+str(r)+str(w)
-    else:
-      if p < 100:
-        mesh = str(o)+"0"+str(p)+"0"+str(u)+str(q)+str(v)+str(r)+str(w)
-      else:
-        mesh = str(o)+str(p)+"0"+str(u)+str(q)+str(v)+str(r)+str(w)
-  else:
-    if p < 10:
-      mesh = str(o)+"00"+str(p)+str(u)+str(q)+str(v)+str(r)+str(w)
-    else:
-      if(p < 100):
-        mesh = str(o)+"0"+str(p)+str(u)+str(q)+str(v)+str(r)+str(w)
-      else:
-        mesh = str(o)+str(p)+str(u)+str(q)+str(v)+str(r)+str(w)
-  return mesh
+  return cal_meshcode_level(latitude, longitude, 3)
 
 # calculate 4th mesh code
 def cal_meshcode4(latitude, longitude):
-  if latitude < -90 or latitude > 90 or longitude < -180 or longitude > 180:
-    return "99999999999"
-  if latitude < 0:
-    o = 4
-  else:
-    o = 0
-  if longitude < 0:
-    o = o + 2
-  if abs(longitude) >= 100:
-    o = o + 1
-  z = o % 2
-  y = ((o - z)/2) % 2
-  x = (o - 2*y - z)/4
-#
-  o = o + 1
-#
-  latitude = (1-2*x)*latitude
-  longitude = (1-2*y)*longitude
-  #
-  p = math.floor(latitude*60/40)
-  a = (latitude*60/40-p)*40
-  q = math.floor(a/5)
-  b = (a/5-q)*5
-  r = math.floor(b*60/30)
-  c = (b*60/30-r)*30
-  s2u = math.floor(c/15)
-  u = math.floor(longitude-100*z)
-  f = longitude-100*z-u
-  v = math.floor(f*60/7.5)
-  g = (f*60/7.5-v)*7.5
-  w = math.floor(g*60/45)
-  h = (g*60/45-w)*45
-  s2l = math.floor(h/22.5)
-  s2 = s2u*2+s2l+1
-  #
-  o = int(o)
-  p = int(p)
-  u = int(u)
-  q = int(q)
-  v = int(v)
-  r = int(r)
-  w = int(w)
-  s2 = int(s2)
-  #
-  if u < 10:
-    if p < 10:
-      mesh = str(o)+"00"+str(p)+"0"+str(u)+str(q)+str(v)+str(r)+str(w)+str(s2)
+  return cal_meshcode_level(latitude, longitude, 4)
+
+# calculate 5th mesh code
+def cal_meshcode5(latitude, longitude):
+  return cal_meshcode_level(latitude, longitude, 5)
+
+# calculate 6th mesh code
+def cal_meshcode6(latitude, longitude):
+  mesh = cal_meshcode_level(latitude, longitude, 6)
+  # an integer is returned for a position in range as in Version 1.2
+  if mesh == "9999999999999":
+    return mesh
+  return int(mesh)
+
+# calculate a mesh code of any level
+def cal_meshcode_level(latitude, longitude, level):
+  _check_level(level)
+  code = _latlong_to_meshcode_int(latitude, longitude, level)
+  if code is None:
+    return "9"*_MESH_LENGTHS[level-1]
+  return str(code)
+
+# Level descriptors of the grid square code :
+# (code length, divisions per side from the upper level, latitude step, longitude step)
+# The digit of a level for latitude is floor(t) with t = X*mul/div for the
+# step (mul, div, back), and X of the next level is (t-digit)*back, where X
+# is the (absolute) latitude at the 1st level. Longitude is calculated in
+# the same way, except that the 1st level takes the integer part of the
+# longitude (minus 100 for 100 degrees and more). The order of the
+# operations is that of Version 1.2 so that the codes are identical.
+# Levels with 2 divisions are quadrants coded as
+#     N
+#   3 | 4
+# W - + - E
+#   1 | 2
+#     S
+_MESH_LEVEL_TABLE = [
+    (6, 1, (60, 40, 40), None),                     # 80km
+    (8, 8, (1, 5, 5), (60, 7.5, 7.5)),              # 10km
+    (10, 10, (60, 30, 30), (60, 45, 45)),           # 1km
+    (11, 2, (1, 15, 15), (1, 22.5, 22.5)),          # 500m
+    (12, 2, (1, 7.5, 7.5), (1, 11.25, 11.25)),      # 250m
+    (13, 2, (1, 3.75, 3.75), (1, 5.625, 5.625)),    # 125m
+]
+# finer quadrants (62.5m, 31.25m, ...) up to 19 digits, which fit in a 64-bit integer
+_MESH_LEVEL_TABLE = _MESH_LEVEL_TABLE + [(13+k, 2, (1, 3.75/2**k, 3.75/2**k), (1, 5.625/2**k, 5.625/2**k)) for k in range(1, 7)]
+
+_MESH_LENGTHS = [d[0] for d in _MESH_LEVEL_TABLE]
+_MESH_LEVELS = dict((n, i+1) for i, n in enumerate(_MESH_LENGTHS))
+_MESH_DIVISIONS = [d[1] for d in _MESH_LEVEL_TABLE]
+_LAT_STEPS = [d[2] for d in _MESH_LEVEL_TABLE]
+_LONG_STEPS = [d[3] for d in _MESH_LEVEL_TABLE]
+# number of grid squares per side of an 80km grid square at each level
+_MESH_UNITS = [1, 8, 80] + [80*2**k for k in range(1, len(_MESH_LEVEL_TABLE)-2)]
+
+def _check_level(level):
+    if not 1 <= level <= len(_MESH_LEVEL_TABLE):
+        raise ValueError("level %s is not in 1 to %d" % (level, len(_MESH_LEVEL_TABLE)))
+
+def _latlong_to_meshcode_int(latitude, longitude, level):
+    if latitude < -90 or latitude > 90 or longitude < -180 or longitude > 180:
+        return None
+    o = 1
+    if latitude < 0:
+        o = o + 4
+        latitude = -latitude
+    if longitude < 0:
+        o = o + 2
+        longitude = -longitude
+    if longitude >= 100:
+        o = o + 1
+        t_long = longitude - 100
+    else:
+        t_long = longitude - 0
+    mul, div, back = _LAT_STEPS[0]
+    t_lat = latitude*mul/div
+    p = math.floor(t_lat)
+    u = math.floor(t_long)
+    code = (o*1000 + int(p))*100 + int(u)
+    x_lat = (t_lat-p)*back
+    x_long = t_long-u
+    for n in range(1, level):
+        mul, div, back = _LAT_STEPS[n]
+        t_lat = x_lat*mul/div
+        a = math.floor(t_lat)
+        x_lat = (t_lat-a)*back
+        mul, div, back = _LONG_STEPS[n]
+        t_long = x_long*mul/div
+        b = math.floor(t_long)
+        x_long = (t_long-b)*back
+        if _MESH_DIVISIONS[n] == 2:
+            code = code*10 + int(a*2+b+1)
+        else:
+            code = code*100 + int(a*10+b)
+    return code
+
+def _index_to_grid(level, row, col):
+    units = _MESH_UNITS[level-1]
+    lat0 = round((row + 1 - 135*units)*2 / (3.0*units), 8)
+    lat1 = round((row - 135*units)*2 / (3.0*units), 8)
+    long0 = round((col - 180*units) / float(units), 8)
+    long1 = round((col + 1 - 180*units) / float(units), 8)
+    return lat0, long0, lat1, long1
+
+# The global index (row, col) of a grid square counts grid squares of its
+# level from the south pole (row) and from 180 degrees west (col).
+# An 80km grid square is 2/3 arc-degree by 1 arc-degree, thus there are
+# 135 rows north of the equator and 180 columns east of Greenwich.
+
+def meshcode_level(meshcode):
+    return _MESH_LEVELS.get(len(str(meshcode)))
+
+def _meshcode_to_index(code, level):
+    o = int(code[0:1]) - 1
+    z = o % 2
+    y = (o // 2) % 2
+    x = o // 4
+    lat = int(code[1:4])
+    lng = int(code[4:6]) + 100*z
+    pos = 6
+    for division in _MESH_DIVISIONS[1:level]:
+        if division == 2:
+            # code 9, 10, 11 : 1 = SW, 2 = SE, 3 = NW, 4 = NE
+            s = int(code[pos:pos+1]) - 1
+            lat = lat*2 + s//2
+            lng = lng*2 + s%2
+            pos = pos + 1
+        else:
+            lat = lat*division + int(code[pos:pos+1])
+            lng = lng*division + int(code[pos+1:pos+2])
+            pos = pos + 2
+    units = _MESH_UNITS[level-1]
+    if x == 0:
+        row = 135*units + lat
     else:
-      if p < 100:
-        mesh = str(o)+"0"+str(p)+"0"+str(u)+str(q)+str(v)+str(r)+str(w)+str(s2)
-      else:
-        mesh = str(o)+str(p)+"0"+str(u)+str(q)+str(v)+str(r)+str(w)+str(s2)
-  else:
-    if p < 10:
-      mesh = str(o)+"00"+str(p)+str(u)+str(q)+str(v)+str(r)+str(w)+str(s2)
+        row = 135*units - 1 - lat
+    if y == 0:
+        col = 180*units + lng
     else:
-      if p < 100:
-        mesh = str(o)+"0"+str(p)+str(u)+str(q)+str(v)+str(r)+str(w)+str(s2)
-      else:
-        mesh = str(o)+str(p)+str(u)+str(q)+str(v)+str(r)+str(w)+str(s2)
-  return mesh
+        col = 180*units - 1 - lng
+    return row, col
 
-# calculate 5rd mesh code
-def cal_meshcode5(latitude, longitude):
-  if latitude < -90 or latitude > 90 or longitude < -180 or longitude > 180:
-    return "999999999999"
-  if latitude < 0:
-    o = 4
-  else:
-    o = 0
-  if longitude < 0:
-    o = o + 2
-  if abs(longitude) >= 100:
-    o = o + 1
-  z = o % 2
-  y = ((o - z)/2) % 2
-  x = (o - 2*y - z)/4
-#
-  o = o + 1
-#
-  latitude = (1-2*x)*latitude
-  longitude = (1-2*y)*longitude
-  #
-  p = math.floor(latitude*60/40)
-  a = (latitude*60/40-p)*40
-  q = math.floor(a/5)
-  b = (a/5-q)*5
-  r = math.floor(b*60/30)
-  c = (b*60/30-r)*30
-  s2u = math.floor(c/15)
-  d = (c/15-s2u)*15
-  s4u = math.floor(d/7.5)
-  u = math.floor(longitude-100*z)
-  f = longitude-100*z-u
-  v = math.floor(f*60/7.5)
-  g = (f*60/7.5-v)*7.5
-  w = math.floor(g*60/45)
-  h = (g*60/45-w)*45
-  s2l =math.floor(h/22.5)
-  i = (h/22.5-s2l)*22.5
-  s4l = math.floor(i/11.25)
-  s2 = s2u*2+s2l+1
-  s4 = s4u*2+s4l+1
-  #
-  o = int(o)
-  p = int(p)
-  u = int(u)
-  q = int(q)
-  v = int(v)
-  r = int(r)
-  w = int(w)
-  s2 = int(s2)
-  s4 = int(s4)
-  #
-  if u < 10:
-    if p < 10:
-      mesh = str(o)+"00"+str(p)+"0"+str(u)+str(q)+str(v)+str(r)+str(w)+str(s2)+str(s4)
+def _meshcode_to_valid_index(code, level):
+    # _meshcode_to_index() of a code of level, None when a digit is out of range
+    if len(code) != _MESH_LENGTHS[level-1] or code.strip("0123456789") or not "1" <= code[0] <= "8":
+        return None
+    pos = 6
+    for division in _MESH_DIVISIONS[1:level]:
+        if division == 2:
+            if not "1" <= code[pos] <= "4":
+                return None
+            pos = pos + 1
+        else:
+            if int(code[pos]) >= division or int(code[pos+1]) >= division:
+                return None
+            pos = pos + 2
+    row, col = _meshcode_to_index(code, level)
+    units = _MESH_UNITS[level-1]
+    if row < 0 or row >= 270*units or col < 0 or col >= 360*units:
+        return None
+    return row, col
+
+def _index_to_meshcode(level, row, col):
+    units = _MESH_UNITS[level-1]
+    if row < 0 or row >= 270*units:
+        return None
+    col = col % (360*units)
+    if row >= 135*units:
+        x = 0
+        lat = row - 135*units
+    else:
+        x = 1
+        lat = 135*units - 1 - row
+    if col >= 180*units:
+        y = 0
+        lng = col - 180*units
     else:
-      if p < 100:
-        mesh = str(o)+"0"+str(p)+"0"+str(u)+str(q)+str(v)+str(r)+str(w)+str(s2)+str(s4)
-      else:
-        mesh = str(o)+str(p)+"0"+str(u)+str(q)+str(v)+str(r)+str(w)+str(s2)+str(s4)
-  else:
-    if p < 10:
-      mesh = str(o)+"00"+str(p)+str(u)+str(q)+str(v)+str(r)+str(w)+str(s2)+str(s4)
+        y = 1
+        lng = 180*units - 1 - col
+    digits = []
+    for division in reversed(_MESH_DIVISIONS[1:level]):
+        if division == 2:
+            digits.append(str((lat%2)*2 + lng%2 + 1))
+        else:
+            digits.append(str(lng % division))
+            digits.append(str(lat % division))
+        lat = lat // division
+        lng = lng // division
+    if lng >= 100:
+        z = 1
     else:
-      if p < 100:
-        mesh = str(o)+"0"+str(p)+str(u)+str(q)+str(v)+str(r)+str(w)+str(s2)+str(s4)
-      else:
-        mesh = str(o)+str(p)+str(u)+str(q)+str(v)+str(r)+str(w)+str(s2)+str(s4)
-  return mesh
+        z = 0
+    o = 4*x + 2*y + z + 1
+    digits.reverse()
+    return str(o) + "%03d" % lat + "%02d" % (lng - 100*z) + "".join(digits)
 
-# calculate 6rd mesh code
-def cal_meshcode6(latitude, longitude):
-  if latitude < -90 or latitude > 90 or longitude < -180 or longitude > 180:
-      return "9999999999999"
-  if latitude < 0:
-    o = 4
-  else:
-    o = 0
-  if longitude < 0:
-    o = o + 2
-  if abs(longitude) >= 100:
-    o = o + 1
-  z = o % 2
-  y = ((o - z)/2) % 2
-  x = (o - 2*y - z)/4
-#
-  o = o + 1
-#
-  latitude = (1-2*x)*latitude
-  longitude = (1-2*y)*longitude
-  #
-  p = math.floor(latitude*60/40)
-  a = (latitude*60/40-p)*40
-  q = math.floor(math.floor(a/5))
-  b = (a/5-q)*5
-  r = math.floor(b*60/30)
-  c = (b*60/30-r)*30
-  s2u = math.floor(c/15)
-  d = (c/15-s2u)*15
-  s4u = math.floor(d/7.5)
-  e = (d/7.5-s4u)*7.5
-  s8u = math.floor(e/3.75)
-  u = math.floor(longitude-100*z)
-  f = longitude-100*z-u
-  v = math.floor(f*60/7.5)
-  g = (f*60/7.5-v)*7.5
-  w = math.floor(g*60/45)
-  h = (g*60/45-w)*45
-  s2l = math.floor(h/22.5)
-  i = (h/22.5-s2l)*22.5
-  s4l = math.floor(i/11.25)
-  j = (i/11.25-s4l)*11.25
-  s8l = math.floor(j/5.625)
-  s2 = s2u*2+s2l+1
-  s4 = s4u*2+s4l+1
-  s8 = s8u*2+s8l+1
-  #
-  o = int(o)
-  p = int(p)
-  u = int(u)
-  q = int(q)
-  v = int(v)
-  r = int(r)
-  w = int(w)
-  s2 = int(s2)
-  s4 = int(s4)
-  s8 = int(s8)
-  #
-  if u < 10:
-   if p < 10:
-     mesh = str(o)+"00"+str(p)+"0"+str(u)+str(q)+str(v)+str(r)+str(w)+str(s2)+str(s4)+str(s8)
-   else:
-     if p < 100:
-       mesh = str(o)+"0"+str(p)+"0"+str(u)+str(q)+str(v)+str(r)+str(w)+str(s2)+str(s4)+str(s8)
-     else:
-       mesh = str(o)+str(p)+"0"+str(u)+str(q)+str(v)+str(r)+str(w)+str(s2)+str(s4)+str(s8)
-  else:
-   if p < 10:
-     mesh = str(o)+"00"+str(p)+str(u)+str(q)+str(v)+str(r)+str(w)+str(s2)+str(s4)+str(s8)
-   else:
-     if p < 100:
-       mesh = str(o)+"0"+str(p)+str(u)+str(q)+str(v)+str(r)+str(w)+str(s2)+str(s4)+str(s8)
-     else:
-       mesh = str(o)+str(p)+str(u)+str(q)+str(v)+str(r)+str(w)+str(s2)+str(s4)+str(s8)
-  return int(mesh)
+# Array versions of the calculations above, for numpy arrays of float64
+# positions and of int64 grid square codes (0 for a missing code). They
+# follow the same steps as the functions for a single grid square, so that
+# the results are identical, and are shared by the batch functions,
+# worldmesh_arrow.py and worldmesh_pandas.py. The functions for a single
+# grid square are kept in plain Python so that worldmesh.py does not
+# require numpy.
+if np is not None:
+    _POW10 = 10 ** np.arange(19, dtype=np.int64)
+    _LEVEL_OF_LENGTH = np.zeros(21, dtype=np.int8)
+    for _i, _n in enumerate(_MESH_LENGTHS):
+        _LEVEL_OF_LENGTH[_n] = _i + 1
+
+def _code_lengths_array(codes):
+    # number of digits (0 for 0)
+    return np.searchsorted(_POW10, codes, side="right")
+
+def _levels_array(lengths):
+    # level of each code length, 0 for an unknown length
+    return _LEVEL_OF_LENGTH[np.minimum(lengths, len(_LEVEL_OF_LENGTH)-1)]
+
+def _level_groups(levels):
+    for level in np.unique(levels):
+        if level != 0:
+            yield int(level), levels == level
+
+def _latlong_to_meshcode_array(latitude, longitude, level):
+    # _latlong_to_meshcode_int() for arrays, 0 for a position out of range
+    latitude = np.asarray(latitude, dtype=np.float64)
+    longitude = np.asarray(longitude, dtype=np.float64)
+    with np.errstate(invalid="ignore"):
+        valid = (latitude >= -90) & (latitude <= 90) & (longitude >= -180) & (longitude <= 180)
+    latitude = np.where(valid, latitude, 0.0)
+    longitude = np.where(valid, longitude, 0.0)
+    south = latitude < 0
+    west = longitude < 0
+    latitude = np.where(south, -latitude, latitude)
+    longitude = np.where(west, -longitude, longitude)
+    east100 = longitude >= 100
+    o = 1 + 4*south.astype(np.int64) + 2*west.astype(np.int64) + east100.astype(np.int64)
+    t_long = longitude - np.where(east100, 100.0, 0.0)
+    mul, div, back = _LAT_STEPS[0]
+    t_lat = latitude*mul/div
+    p = np.floor(t_lat)
+    u = np.floor(t_long)
+    code = (o*1000 + p.astype(np.int64))*100 + u.astype(np.int64)
+    x_lat = (t_lat-p)*back
+    x_long = t_long-u
+    for n in range(1, level):
+        mul, div, back = _LAT_STEPS[n]
+        t_lat = x_lat*mul/div
+        a = np.floor(t_lat)
+        x_lat = (t_lat-a)*back
+        mul, div, back = _LONG_STEPS[n]
+        t_long = x_long*mul/div
+        b = np.floor(t_long)
+        x_long = (t_long-b)*back
+        a = a.astype(np.int64)
+        b = b.astype(np.int64)
+        if _MESH_DIVISIONS[n] == 2:
+            code = code*10 + a*2 + b + 1
+        else:
+            code = code*100 + a*10 + b
+    code[~valid] = 0
+    return code
+
+def _code_digits_array(codes, level, pos, count):
+    # count digits from pos of codes all at level
+    return codes // _POW10[_MESH_LENGTHS[level-1]-pos-count] % _POW10[count]
+
+def _meshcode_to_index_array(codes, level):
+    # _meshcode_to_index() for an array of codes all at level
+    def digits(pos, count):
+        return _code_digits_array(codes, level, pos, count)
+    o = digits(0, 1) - 1
+    z = o % 2
+    y = (o // 2) % 2
+    x = o // 4
+    lat = digits(1, 3)
+    lng = digits(4, 2) + 100*z
+    pos = 6
+    for division in _MESH_DIVISIONS[1:level]:
+        if division == 2:
+            s = digits(pos, 1) - 1
+            lat = lat*2 + s//2
+            lng = lng*2 + s%2
+            pos = pos + 1
+        else:
+            lat = lat*division + digits(pos, 1)
+            lng = lng*division + digits(pos+1, 1)
+            pos = pos + 2
+    units = _MESH_UNITS[level-1]
+    row = np.where(x == 0, 135*units + lat, 135*units - 1 - lat)
+    col = np.where(y == 0, 180*units + lng, 180*units - 1 - lng)
+    return row, col
+
+def _index_to_meshcode_array(level, row, col):
+    # _index_to_meshcode() for arrays, 0 for a row out of range
+    units = _MESH_UNITS[level-1]
+    valid = (row >= 0) & (row < 270*units)
+    col = col % (360*units)
+    north = row >= 135*units
+    east = col >= 180*units
+    lat = np.where(north, row - 135*units, 135*units - 1 - row)
+    lng = np.where(east, col - 180*units, 180*units - 1 - col)
+    tail = np.zeros(len(row), dtype=np.int64)
+    scale = 1
+    for division in reversed(_MESH_DIVISIONS[1:level]):
+        if division == 2:
+            tail = tail + ((lat%2)*2 + lng%2 + 1)*scale
+            scale = scale*10
+        else:
+            tail = tail + ((lat%division)*10 + lng%division)*scale
+            scale = scale*100
+        lat = lat // division
+        lng = lng // division
+    z = (lng >= 100).astype(np.int64)
+    o = 4*(~north) + 2*(~east) + z + 1
+    code = ((o*1000 + lat)*100 + lng - 100*z)*scale + tail
+    return np.where(valid, code, 0)
+
+def _meshcode_valid_array(codes, level):
+    # whether _meshcode_to_valid_index() gives an index, for codes all at level
+    valid = (codes // _POW10[_MESH_LENGTHS[level-1]-1] >= 1) & (codes // _POW10[_MESH_LENGTHS[level-1]-1] <= 8)
+    pos = 6
+    for division in _MESH_DIVISIONS[1:level]:
+        if division == 2:
+            s = _code_digits_array(codes, level, pos, 1)
+            valid = valid & (s >= 1) & (s <= 4)
+            pos = pos + 1
+        else:
+            valid = valid & (_code_digits_array(codes, level, pos, 1) < division)
+            valid = valid & (_code_digits_array(codes, level, pos+1, 1) < division)
+            pos = pos + 2
+    row, col = _meshcode_to_index_array(codes, level)
+    units = _MESH_UNITS[level-1]
+    return valid & (row >= 0) & (row < 270*units) & (col >= 0) & (col < 360*units)
+
+def _valid_level_groups(codes, levels):
+    # (level, positions, row, col) of the valid codes of each level
+    for level, sel in _level_groups(levels):
+        sel = np.flatnonzero(sel)
+        sel = sel[_meshcode_valid_array(codes[sel], level)]
+        row, col = _meshcode_to_index_array(codes[sel], level)
+        yield level, sel, row, col
+
+def _round8_array(values):
+    # round(value, 8) of Python for an array, without a Python object per
+    # value. round() rounds the exact binary value, halfway cases to even,
+    # while values*1e8 is itself rounded; the product is therefore split
+    # into p + e exactly (Dekker's product, 1e8 having only 19 significant
+    # bits) and compared with the halfway point above floor(p)
+    p = values*1e8
+    c = values*134217729.0
+    hi = c - (c - values)
+    lo = values - hi
+    e = (hi*1e8 - p) + lo*1e8
+    r = np.floor(p)
+    d = (p - (r + 0.5)) + e
+    r = r + ((d > 0) | ((d == 0) & (np.fmod(r, 2) != 0)))
+    return r/1e8
+
+def _index_to_grid_array(level, row, col):
+    # _index_to_grid() for arrays
+    units = _MESH_UNITS[level-1]
+    lat0 = _round8_array((row + 1 - 135*units)*2 / (3.0*units))
+    lat1 = _round8_array((row - 135*units)*2 / (3.0*units))
+    long0 = _round8_array((col - 180*units) / float(units))
+    long1 = _round8_array((col + 1 - 180*units) / float(units))
+    return lat0, long0, lat1, long1
+
+def _meshcode_to_grid_array(codes, lengths):
+    # lat0, long0, lat1, long1 of codes of mixed levels as meshcode_to_latlong_grid(),
+    # 99999 for an unknown length of 6 digits or more and NaN for a shorter (or missing) code
+    levels = _levels_array(lengths)
+    unknown = (levels == 0) & (lengths >= 6)
+    grid = [np.where(unknown, 99999.0, np.nan) for k in range(4)]
+    for level, sel in _level_groups(levels):
+        row, col = _meshcode_to_index_array(codes[sel], level)
+        for values, part in zip(grid, _index_to_grid_array(level, row, col)):
+            values[sel] = part
+    return grid
+
+def _meshcode_to_center_array(codes, levels):
+    # central positions (rounded as meshcode_to_latlong_center()) of codes of
+    # mixed levels, NaN for an unknown level (0)
+    lat = np.full(len(codes), np.nan)
+    lng = np.full(len(codes), np.nan)
+    for level, sel in _level_groups(levels):
+        row, col = _meshcode_to_index_array(codes[sel], level)
+        lat_c, long_c = _index_to_center_array(level, row, col)
+        lat[sel] = _round8_array(lat_c)
+        lng[sel] = _round8_array(long_c)
+    return lat, lng
+
+def _row_area_array(level, row):
+    # _row_area() for an array of rows
+    units = _MESH_UNITS[level-1]
+    lat_s = np.radians((row - 135*units)*2 / (3.0*units))
+    lat_n = np.radians((row + 1 - 135*units)*2 / (3.0*units))
+    return _EARTH_RADIUS*_EARTH_RADIUS*math.radians(1.0/units)*(np.sin(lat_n)-np.sin(lat_s))
+
+def _row_size_array(level, row):
+    # _row_size() for an array of rows
+    units = _MESH_UNITS[level-1]
+    lat, lng = _index_to_center_array(level, row, 0)
+    width = _EARTH_RADIUS*np.cos(np.radians(lat))*math.radians(1.0/units)
+    height = np.full(len(row), _EARTH_RADIUS*math.radians(2.0/(3.0*units)))
+    return width, height
+
+def _haversine_array(lat0, long0, lat1, long1):
+    # _haversine() for arrays
+    phi0 = np.radians(lat0)
+    phi1 = np.radians(lat1)
+    a = np.sin((phi1-phi0)/2)**2 + np.cos(phi0)*np.cos(phi1)*np.sin(np.radians(long1-long0)/2)**2
+    return 2*_EARTH_RADIUS*np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+def _meshcode_array(meshcodes):
+    # int64 codes and their lengths from a list of grid square codes, None
+    # when numpy is not installed or a code is neither a positive integer
+    # nor a string of digits (the batch functions then work code by code)
+    if np is None:
+        return None
+    try:
+        values = np.asarray(meshcodes)
+        if values.ndim != 1 or len(values) == 0:
+            return None
+        if values.dtype.kind in "iu":
+            codes = values.astype(np.int64)
+            if (codes <= 0).any():
+                return None
+            return codes, _code_lengths_array(codes)
+        if values.dtype.kind == "U" and np.char.isdigit(values).all():
+            lengths = np.char.str_len(values)
+            if lengths.max() <= 19:
+                return values.astype(np.int64), lengths
+    except (ValueError, OverflowError):
+        pass
+    return None
+
+def _array_to_list(values, missing):
+    # list of the values of an array, None where missing
+    values = values.astype(object)
+    values[missing] = None
+    return values.tolist()
+
+def _codes_to_list(codes):
+    # list of grid square codes (strings), None for 0
+    return _array_to_list(codes.astype(str), codes == 0)
+
+def _index_to_center_array(level, row, col):
+    # _index_to_center() for arrays
+    units = _MESH_UNITS[level-1]
+    lat = (row + 0.5 - 135*units)*2 / (3.0*units)
+    lng = (col + 0.5 - 180*units) / float(units)
+    return lat, lng
+
+def meshcode_parent(meshcode, level=None):
+    code = str(meshcode)
+    current = _MESH_LEVELS.get(len(code))
+    if current is None:
+        return None
+    if level is None:
+        level = current - 1
+    if level < 1 or level > current:
+        return None
+    return code[0:_MESH_LENGTHS[level-1]]
+
+def meshcode_children(meshcode):
+    code = str(meshcode)
+    level = _MESH_LEVELS.get(len(code))
+    if level is None or level == len(_MESH_LENGTHS):
+        return None
+    row, col = _meshcode_to_index(code, level)
+    division = _MESH_DIVISIONS[level]
+    children = []
+    for i in range(division):
+        for j in range(division):
+            children.append(_index_to_meshcode(level+1, row*division+i, col*division+j))
+    return children
+
+# offsets (row, col) of the neighbors in the order N, NE, E, SE, S, SW, W, NW
+_NEIGHBOR_OFFSETS = [(1,0), (1,1), (0,1), (-1,1), (-1,0), (-1,-1), (0,-1), (1,-1)]
+
+def meshcode_neighbors(meshcode):
+    code = str(meshcode)
+    level = _MESH_LEVELS.get(len(code))
+    if level is None:
+        return None
+    row, col = _meshcode_to_index(code, level)
+    return [_index_to_meshcode(level, row+dr, col+dc) for (dr, dc) in _NEIGHBOR_OFFSETS]
+
+def meshcode_to_latlong_grid_batch(meshcodes):
+    arrays = _meshcode_array(meshcodes)
+    if arrays is not None:
+        codes, lengths = arrays
+        levels = _levels_array(lengths)
+        unknown = levels == 0
+        res = {}
+        for name, values in zip(("lat0", "long0", "lat1", "long1"), _meshcode_to_grid_array(codes, lengths)):
+            values = values.astype(object)
+            # unknown length: same result as meshcode_to_latlong_grid()
+            values[unknown] = None
+            values[unknown & (lengths >= 6)] = int("99999")
+            res[name] = values.tolist()
+        res["level"] = _array_to_list(levels, unknown)
+        return res
+    n = len(meshcodes)
+    lat0 = [None]*n
+    long0 = [None]*n
+    lat1 = [None]*n
+    long1 = [None]*n
+    levels = [None]*n
+    for i, meshcode in enumerate(meshcodes):
+        code = str(meshcode)
+        level = _MESH_LEVELS.get(len(code))
+        if level is None:
+            # unknown length: same result as meshcode_to_latlong_grid()
+            res = meshcode_to_latlong_grid(code)
+            if res is not None:
+                lat0[i] = res["lat0"]
+                long0[i] = res["long0"]
+                lat1[i] = res["lat1"]
+                long1[i] = res["long1"]
+            continue
+        lat0[i], long0[i], lat1[i], long1[i] = _index_to_grid(level, *_meshcode_to_index(code, level))
+        levels[i] = level
+    return {"lat0":lat0, "long0":long0, "lat1":lat1, "long1":long1, "level":levels}
+
+def meshcode_parent_batch(meshcodes, level=None):
+    # a parent is a prefix of the code, which slicing gives faster than numpy
+    parents = [None]*len(meshcodes)
+    levels = [None]*len(meshcodes)
+    for i, meshcode in enumerate(meshcodes):
+        code = str(meshcode)
+        current = _MESH_LEVELS.get(len(code))
+        if current is None:
+            continue
+        levels[i] = current
+        if level is None:
+            target = current - 1
+        else:
+            target = level
+        if 1 <= target <= current:
+            parents[i] = code[0:_MESH_LENGTHS[target-1]]
+    return {"parent":parents, "level":levels}
+
+def meshcode_neighbors_batch(meshcodes):
+    arrays = _meshcode_array(meshcodes)
+    if arrays is not None:
+        codes, lengths = arrays
+        levels = _levels_array(lengths)
+        out = np.zeros((len(codes), len(_NEIGHBOR_OFFSETS)), dtype=np.int64)
+        for level, sel in _level_groups(levels):
+            row, col = _meshcode_to_index_array(codes[sel], level)
+            for k, (dr, dc) in enumerate(_NEIGHBOR_OFFSETS):
+                out[sel, k] = _index_to_meshcode_array(level, row+dr, col+dc)
+        neighbors = _array_to_list(out.astype(str), out == 0)
+        for i in np.flatnonzero(levels == 0):
+            neighbors[i] = None
+        return {"neighbors":neighbors, "level":_array_to_list(levels, levels == 0)}
+    neighbors = [None]*len(meshcodes)
+    levels = [None]*len(meshcodes)
+    for i, meshcode in enumerate(meshcodes):
+        code = str(meshcode)
+        level = _MESH_LEVELS.get(len(code))
+        if level is None:
+            continue
+        row, col = _meshcode_to_index(code, level)
+        neighbors[i] = [_index_to_meshcode(level, row+dr, col+dc) for (dr, dc) in _NEIGHBOR_OFFSETS]
+        levels[i] = level
+    return {"neighbors":neighbors, "level":levels}
+
+def cal_meshcode_batch(latitudes, longitudes, level):
+    _check_level(level)
+    return [cal_meshcode_level(latitude, longitude, level) for latitude, longitude in zip(latitudes, longitudes)]
+
+# Grid square codes never start with 0, so that the integer value of a code
+# identifies both the grid square and its level. The positions are encoded
+# once at the deepest level of the targets, and the codes of the upper
+# levels are the leading digits of that code (integer division by 10**k).
+def _meshcode_targets(meshcodes):
+    # level -> integer codes (sorted numpy array, or set without numpy)
+    targets = {}
+    for m in meshcodes:
+        code = str(m)
+        level = _MESH_LEVELS.get(len(code))
+        if level is None:
+            continue
+        if level in targets:
+            targets[level].add(int(code))
+        else:
+            targets[level] = set([int(code)])
+    if np is not None:
+        for level in targets:
+            targets[level] = np.array(sorted(targets[level]), dtype=np.int64)
+    return targets
+
+def _meshcode_join(latitudes, longitudes, targets, offset):
+    index = array("q")
+    codes = array("q")
+    if not targets:
+        return {"index":index, "meshcode":codes}
+    level = max(targets)
+    scales = [(lv, 10**(_MESH_LENGTHS[level-1]-_MESH_LENGTHS[lv-1])) for lv in sorted(targets)]
+    if np is not None:
+        code = _latlong_to_meshcode_array(latitudes, longitudes, level)
+        # the positions in a target t of an upper level are those whose codes
+        # lie in [t*scale, (t+1)*scale), a range of the sorted codes
+        order = np.argsort(code, kind="stable")
+        code = code[order]
+        found = []
+        for lv, scale in scales:
+            t = targets[lv]
+            lo = np.searchsorted(code, t*scale)
+            counts = np.searchsorted(code, (t+1)*scale) - lo
+            pos = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts - lo, counts)
+            found.append((order[pos], np.repeat(t, counts)))
+        i = np.concatenate([f[0] for f in found])
+        keys = np.concatenate([f[1] for f in found])
+        # by position, and by level for a position in several grid squares
+        order = np.argsort(i, kind="stable")
+        index.frombytes((i[order] + offset).astype(np.int64).tobytes())
+        codes.frombytes(keys[order].astype(np.int64).tobytes())
+        return {"index":index, "meshcode":codes}
+    for i, (latitude, longitude) in enumerate(zip(latitudes, longitudes)):
+        code = _latlong_to_meshcode_int(latitude, longitude, level)
+        if code is None:
+            continue
+        for lv, scale in scales:
+            key = code // scale
+            if key in targets[lv]:
+                index.append(offset+i)
+                codes.append(key)
+    return {"index":index, "meshcode":codes}
+
+def meshcode_join(latitudes, longitudes, meshcodes):
+    return _meshcode_join(latitudes, longitudes, _meshcode_targets(meshcodes), 0)
+
+def meshcode_join_chunks(chunks, meshcodes):
+    targets = _meshcode_targets(meshcodes)
+    offset = 0
+    for latitudes, longitudes in chunks:
+        yield _meshcode_join(latitudes, longitudes, targets, offset)
+        offset = offset + len(latitudes)
+
+def meshcode_contains_batch(latitudes, longitudes, meshcodes):
+    index = meshcode_join(latitudes, longitudes, meshcodes)["index"]
+    if np is not None:
+        mask = np.zeros(len(latitudes), dtype=bool)
+        mask[np.frombuffer(index, dtype=np.int64)] = True
+        return mask.tolist()
+    mask = [False]*len(latitudes)
+    for i in index:
+        mask[i] = True
+    return mask
+
+# mean radius of the earth (m)
+_EARTH_RADIUS = 6371008.8
+
+def _meshcode_indices(codes, valid=False):
+    # (level, row, col) of each code, None for an unknown length (and, with
+    # valid, for a code which is not a valid code of its level)
+    indices = [None]*len(codes)
+    for i, code in enumerate(codes):
+        level = _MESH_LEVELS.get(len(code))
+        if level is None:
+            continue
+        if valid:
+            index = _meshcode_to_valid_index(code, level)
+        else:
+            index = _meshcode_to_index(code, level)
+        if index is not None:
+            indices[i] = (level,) + index
+    return indices
+
+def _index_to_center(level, row, col):
+    units = _MESH_UNITS[level-1]
+    lat = (row + 0.5 - 135*units)*2 / (3.0*units)
+    lng = (col + 0.5 - 180*units) / float(units)
+    return lat, lng
+
+def _row_area(level, row):
+    units = _MESH_UNITS[level-1]
+    lat_s = math.radians((row - 135*units)*2 / (3.0*units))
+    lat_n = math.radians((row + 1 - 135*units)*2 / (3.0*units))
+    dlong = math.radians(1.0/units)
+    return _EARTH_RADIUS*_EARTH_RADIUS*dlong*(math.sin(lat_n)-math.sin(lat_s))
+
+def _row_size(level, row):
+    # width and height (m) at the center of the grid squares of a row
+    units = _MESH_UNITS[level-1]
+    lat, lng = _index_to_center(level, row, 0)
+    width = _EARTH_RADIUS*math.cos(math.radians(lat))*math.radians(1.0/units)
+    height = _EARTH_RADIUS*math.radians(2.0/(3.0*units))
+    return width, height
+
+def _haversine(lat0, long0, lat1, long1):
+    phi0 = math.radians(lat0)
+    phi1 = math.radians(lat1)
+    a = math.sin((phi1-phi0)/2)**2 + math.cos(phi0)*math.cos(phi1)*math.sin(math.radians(long1-long0)/2)**2
+    return 2*_EARTH_RADIUS*math.asin(min(1.0, math.sqrt(a)))
+
+def meshcode_to_latlong_center(meshcode):
+    code = str(meshcode)
+    level = _MESH_LEVELS.get(len(code))
+    if level is None:
+        return None
+    lat, lng = _index_to_center(level, *_meshcode_to_index(code, level))
+    xx = {"lat":round(lat, 8), "long":round(lng, 8)}
+    return xx
+
+def meshcode_area(meshcode):
+    code = str(meshcode)
+    level = _MESH_LEVELS.get(len(code))
+    if level is None:
+        return None
+    index = _meshcode_to_valid_index(code, level)
+    if index is None:
+        return None
+    return _row_area(level, index[0])
+
+def meshcode_distance(meshcode0, meshcode1):
+    c0 = meshcode_to_latlong_center(meshcode0)
+    c1 = meshcode_to_latlong_center(meshcode1)
+    if c0 is None or c1 is None:
+        return None
+    return _haversine(c0["lat"], c0["long"], c1["lat"], c1["long"])
+
+def _row_batch(meshcodes, row_func, row_func_array, count):
+    # count values per row (shared by the grid squares of a row) of each code,
+    # None for an unknown length or an invalid code, and the levels
+    arrays = _meshcode_array(meshcodes)
+    if arrays is not None:
+        codes, lengths = arrays
+        levels = _levels_array(lengths)
+        values = [np.full(len(codes), np.nan) for k in range(count)]
+        valid = np.zeros(len(codes), dtype=bool)
+        for level, sel, row, col in _valid_level_groups(codes, levels):
+            part = row_func_array(level, row)
+            if count == 1:
+                part = [part]
+            for v, p in zip(values, part):
+                v[sel] = p
+            valid[sel] = True
+        return [_array_to_list(v, ~valid) for v in values], _array_to_list(levels, ~valid)
+    indices = _meshcode_indices([str(m) for m in meshcodes], valid=True)
+    values = [[None]*len(indices) for k in range(count)]
+    levels = [None]*len(indices)
+    cache = {}
+    for i, index in enumerate(indices):
+        if index is None:
+            continue
+        key = index[0:2]
+        if key not in cache:
+            part = row_func(*key)
+            cache[key] = [part] if count == 1 else part
+        for v, p in zip(values, cache[key]):
+            v[i] = p
+        levels[i] = index[0]
+    return values, levels
+
+def meshcode_area_batch(meshcodes):
+    (areas,), levels = _row_batch(meshcodes, _row_area, _row_area_array, 1)
+    return {"area":areas, "level":levels}
+
+def _centroid_batch(meshcodes):
+    # lat, long (NaN or None where missing) as numpy arrays, or lists without numpy, and levels
+    arrays = _meshcode_array(meshcodes)
+    if arrays is not None:
+        codes, lengths = arrays
+        levels = _levels_array(lengths)
+        lat, lng = _meshcode_to_center_array(codes, levels)
+        return lat, lng, levels
+    indices = _meshcode_indices([str(m) for m in meshcodes])
+    lats = [None]*len(indices)
+    longs = [None]*len(indices)
+    levels = [None]*len(indices)
+    for i, index in enumerate(indices):
+        if index is None:
+            continue
+        lat, lng = _index_to_center(*index)
+        lats[i] = round(lat, 8)
+        longs[i] = round(lng, 8)
+        levels[i] = index[0]
+    return lats, longs, levels
+
+def meshcode_centroid_batch(meshcodes):
+    lats, longs, levels = _centroid_batch(meshcodes)
+    if isinstance(levels, list):
+        return {"lat":lats, "long":longs, "level":levels}
+    unknown = levels == 0
+    return {"lat":_array_to_list(lats, unknown), "long":_array_to_list(longs, unknown),
+            "level":_array_to_list(levels, unknown)}
+
+def meshcode_size_batch(meshcodes):
+    (widths, heights), levels = _row_batch(meshcodes, _row_size, _row_size_array, 2)
+    return {"width":widths, "height":heights, "level":levels}
+
+def meshcode_distance_batch(meshcodes0, meshcodes1):
+    if len(meshcodes0) != len(meshcodes1):
+        raise ValueError("lists of grid square codes differ in length (%d and %d)" % (len(meshcodes0), len(meshcodes1)))
+    lat0, long0, levels0 = _centroid_batch(meshcodes0)
+    lat1, long1, levels1 = _centroid_batch(meshcodes1)
+    if not isinstance(levels0, list) and not isinstance(levels1, list):
+        return _array_to_list(_haversine_array(lat0, long0, lat1, long1), (levels0 == 0) | (levels1 == 0))
+    distances = []
+    for lat0, long0, lat1, long1 in zip(lat0, long0, lat1, long1):
+        if lat0 is None or lat1 is None or lat0 != lat0 or lat1 != lat1:
+            distances.append(None)
+        else:
+            distances.append(_haversine(float(lat0), float(long0), float(lat1), float(long1)))
+    return distances
+
+# margin (arc-degree) inside the edges of a grid square in which a position
+# is checked against the bounds without calculating its grid square code
+_TRACKER_MARGIN = 1e-9
+
+class MeshTracker(object):
+    def __init__(self, level=3, interpolate=False):
+        _check_level(level)
+        self.level = level
+        self.interpolate = interpolate
+        # object_id -> [code, row, col, lat_s, lat_n, long_w, long_e, t, latitude, longitude]
+        self._state = {}
+
+    def current(self, object_id):
+        state = self._state.get(object_id)
+        if state is None:
+            return None
+        return state[0]
+
+    def _locate(self, latitude, longitude):
+        code = _latlong_to_meshcode_int(latitude, longitude, self.level)
+        if code is None:
+            return None
+        code = str(code)
+        row, col = _meshcode_to_index(code, self.level)
+        units = _MESH_UNITS[self.level-1]
+        lat_s = (row - 135*units)*2 / (3.0*units)
+        lat_n = (row + 1 - 135*units)*2 / (3.0*units)
+        long_w = (col - 180*units) / float(units)
+        long_e = (col + 1 - 180*units) / float(units)
+        return [code, row, col, lat_s + _TRACKER_MARGIN, lat_n - _TRACKER_MARGIN,
+                long_w + _TRACKER_MARGIN, long_e - _TRACKER_MARGIN]
+
+    def _crossed(self, object_id, state, new, t, latitude, longitude):
+        # events along the straight line from the previous fix, one pair of
+        # exit and enter per grid square boundary crossed
+        units = _MESH_UNITS[self.level-1]
+        t0 = state[7]
+        r0 = (state[8] + 90)*3*units/2.0
+        c0 = (state[9] + 180)*units
+        r1 = (latitude + 90)*3*units/2.0
+        c1 = (longitude + 180)*units
+        code, row, col = state[0], state[1], state[2]
+        dr = new[1] - row
+        dc = new[2] - col
+        # across 180 degrees
+        if dc > 180*units:
+            dc = dc - 360*units
+            c1 = c1 - 360*units
+        elif dc < -180*units:
+            dc = dc + 360*units
+            c1 = c1 + 360*units
+        step_r = 1 if dr > 0 else -1
+        step_c = 1 if dc > 0 else -1
+        events = []
+        while dr != 0 or dc != 0:
+            # fractions of the line at the next row and column boundaries
+            fr = fc = 1.0
+            if dr != 0 and r1 != r0:
+                fr = (row + (step_r > 0) - r0) / (r1 - r0)
+            if dc != 0 and c1 != c0:
+                fc = (col + (step_c > 0) - c0) / (c1 - c0)
+            if dr != 0 and (dc == 0 or fr <= fc):
+                row = row + step_r
+                dr = dr - step_r
+                f = fr
+            else:
+                col = col + step_c
+                dc = dc - step_c
+                f = fc
+            tt = t0 + min(max(f, 0.0), 1.0)*(t - t0)
+            next_code = _index_to_meshcode(self.level, row, col)
+            events.append({"object_id":object_id, "t":tt, "event":"exit", "meshcode":code})
+            events.append({"object_id":object_id, "t":tt, "event":"enter", "meshcode":next_code})
+            code = next_code
+        return events
+
+    def update(self, object_id, t, latitude, longitude):
+        state = self._state.get(object_id)
+        if state is not None and state[3] < latitude < state[4] and state[5] < longitude < state[6]:
+            state[7:10] = [t, latitude, longitude]
+            return []
+        new = self._locate(latitude, longitude)
+        if state is not None and new is not None and new[0] == state[0]:
+            state[7:10] = [t, latitude, longitude]
+            return []
+        if state is None:
+            events = []
+        elif new is not None and self.interpolate:
+            events = self._crossed(object_id, state, new, t, latitude, longitude)
+        else:
+            events = [{"object_id":object_id, "t":t, "event":"exit", "meshcode":state[0]}]
+        if new is None:
+            self._state.pop(object_id, None)
+        else:
+            if state is None or not self.interpolate:
+                events.append({"object_id":object_id, "t":t, "event":"enter", "meshcode":new[0]})
+            self._state[object_id] = new + [t, latitude, longitude]
+        return events
+
+    def update_batch(self, object_ids, ts, latitudes, longitudes):
+        events = []
+        for object_id, t, latitude, longitude in zip(object_ids, ts, latitudes, longitudes):
+            events.extend(self.update(object_id, t, latitude, longitude))
+        return events
+
+def _half_width(phi0, phi, d):
+    # half width (radian) in longitude of the circle of angular radius d
+    # around latitude phi0 at latitude phi, None outside the circle
+    c = math.cos(phi0)*math.cos(phi)
+    if c <= 0:
+        if math.cos(phi0 - phi) >= math.cos(d):
+            return math.pi
+        return None
+    a = (math.cos(d) - math.sin(phi0)*math.sin(phi)) / c
+    if a > 1:
+        return None
+    if a <= -1:
+        return math.pi
+    return math.acos(a)
+
+def _radius_index(latitude, longitude, radius, level, centroid):
+    # the columns in each row are calculated from the half width of the circle,
+    # so that no distance is calculated per grid square
+    units = _MESH_UNITS[level-1]
+    cols = 360*units
+    # a circle of angular radius pi covers the sphere
+    d = min(float(radius) / _EARTH_RADIUS, math.pi)
+    phi0 = math.radians(latitude)
+    row_min = int(math.floor((max(latitude - math.degrees(d), -90.0) + 90)*3*units/2.0))
+    row_max = int(math.floor((min(latitude + math.degrees(d), 90.0) + 90)*3*units/2.0))
+    row_min = max(row_min, 0)
+    row_max = min(row_max, 270*units - 1)
+    # latitude of the widest part of the circle
+    if math.cos(d) > abs(math.sin(phi0)):
+        phi_w = math.asin(math.sin(phi0)/math.cos(d))
+    else:
+        phi_w = math.copysign(math.pi/2, phi0)
+    phi_w = min(max(phi_w, phi0 - d), phi0 + d)
+    index = []
+    for row in range(row_min, row_max + 1):
+        lat_s = math.radians((row - 135*units)*2 / (3.0*units))
+        lat_n = math.radians((row + 1 - 135*units)*2 / (3.0*units))
+        if centroid:
+            h = _half_width(phi0, (lat_s + lat_n)/2, d)
+            offset = 0.5
+        else:
+            h = _half_width(phi0, min(max(phi_w, lat_s), lat_n), d)
+            offset = 0.0
+        if h is None:
+            continue
+        if h >= math.pi:
+            col_min, col_max = 0, cols - 1
+        else:
+            west = (longitude - math.degrees(h) + 180)*units - offset
+            east = (longitude + math.degrees(h) + 180)*units - offset
+            col_min = int(math.ceil(west)) if centroid else int(math.floor(west))
+            col_max = int(math.floor(east))
+            if col_max - col_min + 1 >= cols:
+                col_min, col_max = 0, cols - 1
+        for col in range(col_min, col_max + 1):
+            index.append((row, col % cols))
+    if not centroid:
+        # the grid square holding the center (as cal_meshcode_level() gives
+        # it) is missed when rounding puts the center just outside a circle
+        # of a tiny radius, or when the center lies on a boundary
+        code = _latlong_to_meshcode_int(latitude, longitude, level)
+        if code is not None:
+            center = _meshcode_to_index(str(code), level)
+            if center not in index:
+                index.insert(bisect_left(index, center), center)
+    return index
+
+def meshcode_radius(latitude, longitude, radius, level, centroid=False):
+    _check_level(level)
+    if latitude < -90 or latitude > 90 or longitude < -180 or longitude > 180:
+        return None
+    return [_index_to_meshcode(level, row, col) for (row, col) in _radius_index(latitude, longitude, radius, level, centroid)]
+
+def meshcode_radius_batch(latitudes, longitudes, radius, level, centroid=False):
+    _check_level(level)
+    # a single radius for every position (including numpy scalars)
+    if isinstance(radius, numbers.Real):
+        radius = [radius]*len(latitudes)
+    return [meshcode_radius(latitude, longitude, r, level, centroid) for latitude, longitude, r in zip(latitudes, longitudes, radius)]
+
+# MeshcodeSet numbers a grid square by row*(360*units)+col of its global
+# index, and keeps the numbers in chunks of 65536 (roaring bitmap). A chunk
+# holding up to 4096 numbers is a sorted array of the lower 16 bits, and
+# a larger chunk is a bitmap held as an integer of 65536 bits.
+_CHUNK_BITS = 16
+_CHUNK_MASK = (1 << _CHUNK_BITS) - 1
+_ARRAY_MAX = 4096
+
+try:
+    _popcount = int.bit_count
+except AttributeError:
+    def _popcount(x):
+        return bin(x).count("1")
+
+def _array_to_bitmap(values):
+    bits = bytearray(1 << (_CHUNK_BITS-3))
+    for v in values:
+        bits[v >> 3] |= 1 << (v & 7)
+    return int.from_bytes(bytes(bits), "little")
+
+def _bitmap_to_array(bitmap):
+    values = array("H")
+    bits = bitmap.to_bytes(1 << (_CHUNK_BITS-3), "little")
+    for i, byte in enumerate(bytearray(bits)):
+        if byte:
+            for j in range(8):
+                if byte >> j & 1:
+                    values.append(i*8 + j)
+    return values
+
+def _container(values):
+    # container from a set of the lower 16 bits, None when empty
+    if not values:
+        return None
+    if len(values) <= _ARRAY_MAX:
+        return array("H", sorted(values))
+    return _array_to_bitmap(values)
+
+def _shrink(bitmap):
+    # container from a bitmap resulting from an operation
+    n = _popcount(bitmap)
+    if n == 0:
+        return None
+    if n <= _ARRAY_MAX:
+        return _bitmap_to_array(bitmap)
+    return bitmap
+
+def _combine(a, b, op):
+    if isinstance(a, array) and isinstance(b, array):
+        if op == "|":
+            return _container(set(a) | set(b))
+        if op == "&":
+            return _container(set(a) & set(b))
+        return _container(set(a) - set(b))
+    if isinstance(a, array):
+        if op == "|":
+            return _array_to_bitmap(a) | b
+        values = [v for v in a if (b >> v & 1) == (op == "&")]
+        return _container(values)
+    if isinstance(b, array):
+        b = _array_to_bitmap(b)
+    if op == "|":
+        return a | b
+    if op == "&":
+        return _shrink(a & b)
+    return _shrink(a & ~b)
+
+class MeshcodeSet(object):
+    def __init__(self, level, meshcodes=None):
+        _check_level(level)
+        self.level = level
+        self._units = _MESH_UNITS[level-1]
+        self._chunks = {}
+        if meshcodes is not None:
+            self.add_batch(meshcodes)
+
+    def _number(self, code):
+        # None for a code which is not a valid code of the level of the set
+        index = _meshcode_to_valid_index(code, self.level)
+        if index is None:
+            return None
+        return index[0]*360*self._units + index[1]
+
+    def _code(self, number):
+        row, col = divmod(number, 360*self._units)
+        return _index_to_meshcode(self.level, row, col)
+
+    def _numbers(self, meshcodes):
+        # chunk -> list of lower 16 bits
+        chunks = {}
+        for m in meshcodes:
+            code = str(m)
+            number = self._number(code)
+            if number is None:
+                raise ValueError("grid square code %s is not a valid code of level %d" % (code, self.level))
+            key = number >> _CHUNK_BITS
+            if key in chunks:
+                chunks[key].append(number & _CHUNK_MASK)
+            else:
+                chunks[key] = [number & _CHUNK_MASK]
+        return chunks
+
+    def add_batch(self, meshcodes):
+        for key, values in self._numbers(meshcodes).items():
+            new = _container(set(values))
+            if key in self._chunks:
+                new = _combine(self._chunks[key], new, "|")
+            self._chunks[key] = new
+
+    def contains_batch(self, meshcodes):
+        result = []
+        for m in meshcodes:
+            number = self._number(str(m))
+            if number is None:
+                result.append(False)
+                continue
+            chunk = self._chunks.get(number >> _CHUNK_BITS)
+            low = number & _CHUNK_MASK
+            if chunk is None:
+                result.append(False)
+            elif isinstance(chunk, array):
+                i = bisect_left(chunk, low)
+                result.append(i < len(chunk) and chunk[i] == low)
+            else:
+                result.append(chunk >> low & 1 == 1)
+        return result
+
+    def __contains__(self, meshcode):
+        return self.contains_batch([meshcode])[0]
+
+    def __len__(self):
+        n = 0
+        for chunk in self._chunks.values():
+            if isinstance(chunk, array):
+                n = n + len(chunk)
+            else:
+                n = n + _popcount(chunk)
+        return n
+
+    def _operate(self, other, op):
+        if self.level != other.level:
+            raise ValueError("levels of the sets differ (%d and %d)" % (self.level, other.level))
+        result = MeshcodeSet(self.level)
+        if op == "|":
+            keys = set(self._chunks) | set(other._chunks)
+        else:
+            keys = self._chunks
+        for key in keys:
+            a = self._chunks.get(key)
+            b = other._chunks.get(key)
+            if b is None:
+                chunk = a if op != "&" else None
+            elif a is None:
+                chunk = b if op == "|" else None
+            else:
+                chunk = _combine(a, b, op)
+            if chunk is not None:
+                result._chunks[key] = chunk
+        return result
+
+    def union(self, other):
+        return self._operate(other, "|")
+
+    def intersection(self, other):
+        return self._operate(other, "&")
+
+    def difference(self, other):
+        return self._operate(other, "-")
+
+    __or__ = union
+    __and__ = intersection
+    __sub__ = difference
+
+    def __eq__(self, other):
+        if not isinstance(other, MeshcodeSet):
+            return NotImplemented
+        return self.level == other.level and self._chunks == other._chunks
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __iter__(self):
+        for key in sorted(self._chunks):
+            chunk = self._chunks[key]
+            if not isinstance(chunk, array):
+                chunk = _bitmap_to_array(chunk)
+            for low in chunk:
+                yield self._code((key << _CHUNK_BITS) | low)
+
+    def to_list(self):
+        return list(self)
+
+    # serialized form (little endian) :
+    # b"WMSC", level (1 byte), number of chunks (4 bytes), then for each chunk
+    # key (4 bytes), type (1 byte, 0 = array, 1 = bitmap), cardinality-1 (2 bytes)
+    # and the sorted lower 16 bits (array) or 8192 bytes (bitmap)
+    def to_bytes(self):
+        out = [struct.pack("<4sBI", b"WMSC", self.level, len(self._chunks))]
+        for key in sorted(self._chunks):
+            chunk = self._chunks[key]
+            if isinstance(chunk, array):
+                data = array("H", chunk)
+                if sys.byteorder == "big":
+                    data.byteswap()
+                out.append(struct.pack("<IBH", key, 0, len(chunk)-1))
+                out.append(data.tobytes())
+            else:
+                out.append(struct.pack("<IBH", key, 1, _popcount(chunk)-1))
+                out.append(chunk.to_bytes(1 << (_CHUNK_BITS-3), "little"))
+        return b"".join(out)
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, level, count = struct.unpack_from("<4sBI", data, 0)
+        if magic != b"WMSC":
+            raise ValueError("not a serialized MeshcodeSet")
+        result = cls(level)
+        pos = struct.calcsize("<4sBI")
+        for i in range(count):
+            key, kind, n = struct.unpack_from("<IBH", data, pos)
+            pos = pos + struct.calcsize("<IBH")
+            if kind == 0:
+                chunk = array("H")
+                chunk.frombytes(data[pos:pos+2*(n+1)])
+                if sys.byteorder == "big":
+                    chunk.byteswap()
+                pos = pos + 2*(n+1)
+            else:
+                size = 1 << (_CHUNK_BITS-3)
+                chunk = int.from_bytes(data[pos:pos+size], "little")
+                pos = pos + size
+            result._chunks[key] = chunk
+        return result
+
+class MeshcodeCache(object):
+    def __init__(self, capacity=100000, precision=7):
+        self.capacity = capacity
+        self.precision = precision
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key, func, *args):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits = self.hits + 1
+                return self._items[key]
+            self.misses = self.misses + 1
+        # calculated outside the lock; a concurrent miss of the same key stores the same value
+        value = func(*args)
+        self._put(key, value)
+        return value
+
+    def _put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.capacity:
+                self._items.popitem(last=False)
+
+    def meshcode_to_latlong_grid(self, meshcode):
+        res = self._get(("grid", str(meshcode)), meshcode_to_latlong_grid, meshcode)
+        if res is None:
+            return None
+        # a copy, so that the cached result cannot be modified
+        return dict(res)
+
+    def cal_meshcode(self, latitude, longitude, level=3):
+        latitude = round(latitude, self.precision)
+        longitude = round(longitude, self.precision)
+        return self._get(("code", latitude, longitude, level), cal_meshcode_level, latitude, longitude, level)
+
+    def warm(self, meshcodes):
+        for m in meshcodes:
+            code = str(m)
+            self._put(("grid", code), meshcode_to_latlong_grid(code))
+
+    def stats(self):
+        with self._lock:
+            return {"hits":self.hits, "misses":self.misses, "size":len(self._items), "capacity":self.capacity}
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.hits = 0
+            self.misses = 0
@@ -0,0 +1,91 @@
+#
+# Python functions to calculate the world grid square code on Apache Arrow
+# arrays and Parquet files (requires pyarrow and numpy).
+#
+# The arrays are converted to numpy and calculated by the numpy kernels of
+# worldmesh.py, which worldmesh_pandas.py uses as well, following the same
+# steps as cal_meshcode_batch() and meshcode_to_latlong_grid_batch(), so
+# that the results (rounded to 8 decimal places for the grid squares) are
+# identical and no Python object is created per row. Null values give null
+# results. A grid square code of an unknown length gives 99999 (6 digits or
+# more) or null (shorter), as meshcode_to_latlong_grid() gives 99999 or None.
+#
+# cal_meshcode_arrow(latitudes, longitudes, level)
+# : calculate grid square codes of level (1 to 12) from arrays of latitudes and longitudes
+# cal_meshcode_int_arrow(latitudes, longitudes, level)
+# : cal_meshcode_arrow() returning the codes as int64 (null for a position out of range)
+# meshcode_to_latlong_grid_arrow(meshcodes)
+# : calculate the table (lat0, long0, lat1, long1, level) of an array of grid square codes of mixed levels
+# append_meshcode_parquet(source, where, latitude, longitude, level, name)
+# : copy the Parquet file source to where one row group at a time, appending the column name of grid square codes
+# append_latlong_grid_parquet(source, where, meshcode)
+# : copy the Parquet file source to where one row group at a time, appending the columns lat0, long0, lat1, long1 and level
+#
+# Column arguments of the Parquet functions are column names. The grid
+# square codes may be stored either as strings or as integers.
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from worldmesh import (_MESH_LENGTHS, _check_level, _code_lengths_array, _levels_array,
+                       _latlong_to_meshcode_array, _meshcode_to_grid_array)
+
+def _to_numpy(values, type, fill):
+    # numpy array of values cast to type, with nulls replaced by fill
+    values = pc.fill_null(pc.cast(values, type), fill)
+    if isinstance(values, pa.ChunkedArray):
+        values = values.combine_chunks()
+    return values.to_numpy(zero_copy_only=False)
+
+def cal_meshcode_int_arrow(latitudes, longitudes, level):
+    _check_level(level)
+    code = _latlong_to_meshcode_array(_to_numpy(latitudes, pa.float64(), np.nan),
+                                      _to_numpy(longitudes, pa.float64(), np.nan), level)
+    return pa.array(code, mask=code == 0, type=pa.int64())
+
+def cal_meshcode_arrow(latitudes, longitudes, level):
+    code = pc.cast(cal_meshcode_int_arrow(latitudes, longitudes, level), pa.string())
+    invalid = pc.and_(pc.is_null(code), pc.and_(pc.is_valid(latitudes), pc.is_valid(longitudes)))
+    return pc.if_else(invalid, "9"*_MESH_LENGTHS[level-1], code)
+
+def meshcode_to_latlong_grid_arrow(meshcodes):
+    if pa.types.is_string(meshcodes.type) or pa.types.is_large_string(meshcodes.type):
+        lengths = _to_numpy(pc.utf8_length(meshcodes), pa.int64(), 0)
+        codes = _to_numpy(meshcodes, pa.int64(), 0)
+    else:
+        codes = _to_numpy(meshcodes, pa.int64(), 0)
+        lengths = _code_lengths_array(codes)
+    level = _levels_array(lengths)
+    out = dict(zip(("lat0", "long0", "lat1", "long1"), _meshcode_to_grid_array(codes, lengths)))
+    table = dict((k, pa.array(v, from_pandas=True)) for k, v in out.items())
+    table["level"] = pa.array(level, mask=level == 0, type=pa.int8())
+    return pa.table(table)
+
+def _map_parquet_row_groups(source, where, func):
+    reader = pq.ParquetFile(source)
+    writer = None
+    try:
+        for i in range(reader.num_row_groups):
+            table = func(reader.read_row_group(i))
+            if writer is None:
+                writer = pq.ParquetWriter(where, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+def append_meshcode_parquet(source, where, latitude, longitude, level, name=None):
+    if name is None:
+        name = "meshcode%d" % level
+    def func(table):
+        return table.append_column(name, cal_meshcode_arrow(table[latitude], table[longitude], level))
+    _map_parquet_row_groups(source, where, func)
+
+def append_latlong_grid_parquet(source, where, meshcode):
+    def func(table):
+        grid = meshcode_to_latlong_grid_arrow(table[meshcode])
+        for name in grid.column_names:
+            table = table.append_column(name, grid[name])
+        return table
+    _map_parquet_row_groups(source, where, func)
@@ -0,0 +1,309 @@
+#
+# pandas extension for the world grid square code (requires pandas).
+#
+# Importing this module registers
+#
+# MeshcodeDtype ("meshcode")
+# : extension dtype holding grid square codes as 64-bit integers (0 for a missing code)
+# DataFrame.worldmesh.encode(level, latitude, longitude)
+# : calculate the Series of grid square codes of level (1 to 12) from the columns latitude and longitude
+# Series.meshcode.level()
+# : level of each grid square code
+# Series.meshcode.bounds()
+# : DataFrame (lat0, long0, lat1, long1, level) as meshcode_to_latlong_grid()
+#   (99999 for an unknown length of 6 digits or more, NaN for a shorter or missing code)
+# Series.meshcode.center()
+# : DataFrame (lat, long) of the central positions of the grid squares
+# Series.meshcode.area()
+# : ground area (m^2) of the grid squares (NaN for an invalid code)
+# Series.meshcode.size()
+# : DataFrame (width, height) in m of the grid squares at their center (NaN for an invalid code)
+# Series.meshcode.distance(other)
+# : great-circle distance (m) between the centers of the grid squares and those of other, element by element
+# Series.meshcode.parent(level)
+# : upper grid square codes at level (one level up by default)
+# Series.meshcode.neighbors()
+# : DataFrame (N, NE, E, SE, S, SW, W, NW) of the adjacent grid square codes
+#
+# The calculations are done on whole columns by the numpy kernels of
+# worldmesh.py, which the batch functions of worldmesh.py use as well, so
+# that the results (rounded to 8 decimal places for bounds() and center())
+# are identical. Grid square codes of mixed levels are processed level by
+# level. The columns of latitude and longitude are looked up as
+# lat/latitude and long/lon/longitude when they are not given.
+#
+# When pyarrow is installed, MeshcodeDtype columns are converted to Arrow
+# as the extension type "worldmesh.meshcode" (int64 storage, null for a
+# missing code), so that DataFrame.to_parquet() works and read_parquet()
+# gives back MeshcodeDtype columns.
+
+import numpy as np
+import pandas as pd
+from pandas.api.extensions import ExtensionArray, ExtensionDtype, register_extension_dtype, take
+from pandas.api.indexers import check_array_indexer
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+from worldmesh import (_MESH_LENGTHS, _NEIGHBOR_OFFSETS, _POW10, _check_level,
+                       _code_lengths_array, _levels_array, _level_groups, _valid_level_groups,
+                       _latlong_to_meshcode_array, _meshcode_to_index_array, _index_to_meshcode_array,
+                       _meshcode_to_grid_array, _meshcode_to_center_array, _row_area_array, _row_size_array,
+                       _haversine_array)
+
+_NEIGHBOR_NAMES = ["N", "NE", "E", "SE", "S", "SW", "W", "NW"]
+
+def _to_int_codes(values):
+    values = np.asarray(values)
+    if values.dtype.kind in "iu":
+        return values.astype(np.int64)
+    codes = np.zeros(len(values), dtype=np.int64)
+    mask = np.asarray(pd.isna(values))
+    if values.dtype.kind == "f":
+        codes[~mask] = values[~mask].astype(np.int64)
+    else:
+        codes[~mask] = np.array([int(str(v)) for v in values[~mask]], dtype=np.int64)
+    return codes
+
+@register_extension_dtype
+class MeshcodeDtype(ExtensionDtype):
+    name = "meshcode"
+    type = str
+    kind = "O"
+    na_value = pd.NA
+
+    @classmethod
+    def construct_array_type(cls):
+        return MeshcodeArray
+
+    def __from_arrow__(self, array):
+        if isinstance(array, pa.ChunkedArray):
+            chunks = array.chunks
+        else:
+            chunks = [array]
+        data = [np.zeros(0, dtype=np.int64)]
+        for chunk in chunks:
+            if isinstance(chunk, pa.ExtensionArray):
+                chunk = chunk.storage
+            if pa.types.is_integer(chunk.type):
+                chunk = chunk.fill_null(0)
+            data.append(_to_int_codes(chunk.to_numpy(zero_copy_only=False)))
+        return MeshcodeArray(np.concatenate(data))
+
+if pa is not None:
+    class MeshcodeArrowType(pa.ExtensionType):
+        def __init__(self):
+            super().__init__(pa.int64(), "worldmesh.meshcode")
+
+        def __arrow_ext_serialize__(self):
+            return b""
+
+        @classmethod
+        def __arrow_ext_deserialize__(cls, storage_type, serialized):
+            return cls()
+
+        def to_pandas_dtype(self):
+            return MeshcodeDtype()
+
+    try:
+        pa.register_extension_type(MeshcodeArrowType())
+    except pa.ArrowKeyError:
+        # already registered
+        pass
+
+class MeshcodeArray(ExtensionArray):
+    def __init__(self, values, copy=False):
+        if copy:
+            self._data = np.array(values, dtype=np.int64)
+        else:
+            self._data = np.asarray(values, dtype=np.int64)
+
+    @classmethod
+    def _from_sequence(cls, scalars, dtype=None, copy=False):
+        if isinstance(scalars, MeshcodeArray):
+            return scalars.copy() if copy else scalars
+        return cls(_to_int_codes(scalars))
+
+    @classmethod
+    def _from_sequence_of_strings(cls, strings, dtype=None, copy=False):
+        return cls._from_sequence(strings, dtype=dtype, copy=copy)
+
+    @classmethod
+    def _from_factorized(cls, values, original):
+        return cls(values)
+
+    @classmethod
+    def _concat_same_type(cls, to_concat):
+        return cls(np.concatenate([a._data for a in to_concat]))
+
+    @property
+    def dtype(self):
+        return MeshcodeDtype()
+
+    @property
+    def nbytes(self):
+        return self._data.nbytes
+
+    def __len__(self):
+        return len(self._data)
+
+    def __getitem__(self, item):
+        if isinstance(item, (int, np.integer)):
+            code = self._data[item]
+            return str(code) if code else pd.NA
+        item = check_array_indexer(self, item)
+        return type(self)(self._data[item])
+
+    def __setitem__(self, key, value):
+        key = check_array_indexer(self, key)
+        if pd.api.types.is_list_like(value):
+            self._data[key] = _to_int_codes(value)
+        else:
+            self._data[key] = _to_int_codes([value])[0]
+
+    def __eq__(self, other):
+        if isinstance(other, (pd.Series, pd.Index, pd.DataFrame)):
+            return NotImplemented
+        if isinstance(other, MeshcodeArray):
+            codes = other._data
+        elif pd.api.types.is_list_like(other):
+            codes = _to_int_codes(other)
+        else:
+            codes = _to_int_codes([other])[0]
+        return (self._data == codes) & (self._data != 0)
+
+    def __array__(self, dtype=None, copy=None):
+        if dtype is not None and np.dtype(dtype).kind in "iu":
+            return self._data.astype(dtype)
+        return np.array([str(c) if c else pd.NA for c in self._data], dtype=object)
+
+    def __arrow_array__(self, type=None):
+        storage = pa.array(self._data, mask=self._data == 0, type=pa.int64())
+        if type is None or isinstance(type, MeshcodeArrowType):
+            return pa.ExtensionArray.from_storage(MeshcodeArrowType(), storage)
+        return storage.cast(type)
+
+    def isna(self):
+        return self._data == 0
+
+    def take(self, indices, allow_fill=False, fill_value=None):
+        if allow_fill and (fill_value is None or pd.isna(fill_value)):
+            fill_value = 0
+        elif allow_fill:
+            fill_value = _to_int_codes([fill_value])[0]
+        return type(self)(take(self._data, indices, allow_fill=allow_fill, fill_value=fill_value))
+
+    def copy(self):
+        return type(self)(self._data, copy=True)
+
+    def astype(self, dtype, copy=True):
+        dtype = pd.api.types.pandas_dtype(dtype)
+        if isinstance(dtype, MeshcodeDtype):
+            return self.copy() if copy else self
+        if not isinstance(dtype, ExtensionDtype) and dtype.kind in "iu":
+            return self._data.astype(dtype, copy=copy)
+        return super().astype(dtype, copy=copy)
+
+    def _values_for_factorize(self):
+        return self._data, 0
+
+    def _values_for_argsort(self):
+        return self._data
+
+def _series_codes(series):
+    if isinstance(series.dtype, MeshcodeDtype):
+        return series.array._data
+    return _to_int_codes(series.to_numpy())
+
+def _find_column(frame, names):
+    for name in names:
+        if name in frame.columns:
+            return name
+    raise KeyError("none of the columns %s" % ", ".join(names))
+
+@pd.api.extensions.register_dataframe_accessor("worldmesh")
+class WorldmeshAccessor(object):
+    def __init__(self, frame):
+        self._frame = frame
+
+    def encode(self, level=3, latitude=None, longitude=None):
+        if latitude is None:
+            latitude = _find_column(self._frame, ["lat", "latitude"])
+        if longitude is None:
+            longitude = _find_column(self._frame, ["long", "lon", "longitude"])
+        _check_level(level)
+        code = _latlong_to_meshcode_array(self._frame[latitude].to_numpy(dtype=np.float64, na_value=np.nan),
+                       self._frame[longitude].to_numpy(dtype=np.float64, na_value=np.nan), level)
+        return pd.Series(MeshcodeArray(code), index=self._frame.index, name="meshcode%d" % level)
+
+@pd.api.extensions.register_series_accessor("meshcode")
+class MeshcodeAccessor(object):
+    def __init__(self, series):
+        self._series = series
+        self._codes = _series_codes(series)
+        self._level = _levels_array(_code_lengths_array(self._codes))
+
+    def _groups(self):
+        return _level_groups(self._level)
+
+    def level(self):
+        level = pd.array(self._level, dtype="Int8")
+        level[self._level == 0] = pd.NA
+        return pd.Series(level, index=self._series.index)
+
+    def bounds(self):
+        grid = _meshcode_to_grid_array(self._codes, _code_lengths_array(self._codes))
+        frame = pd.DataFrame(dict(zip(("lat0", "long0", "lat1", "long1"), grid)), index=self._series.index)
+        frame["level"] = self.level()
+        return frame
+
+    def center(self):
+        lat, lng = _meshcode_to_center_array(self._codes, self._level)
+        return pd.DataFrame({"lat":lat, "long":lng}, index=self._series.index)
+
+    def area(self):
+        area = np.full(len(self._codes), np.nan)
+        for level, sel, row, col in _valid_level_groups(self._codes, self._level):
+            area[sel] = _row_area_array(level, row)
+        return pd.Series(area, index=self._series.index)
+
+    def size(self):
+        n = len(self._codes)
+        width = np.full(n, np.nan)
+        height = np.full(n, np.nan)
+        for level, sel, row, col in _valid_level_groups(self._codes, self._level):
+            width[sel], height[sel] = _row_size_array(level, row)
+        return pd.DataFrame({"width":width, "height":height}, index=self._series.index)
+
+    def distance(self, other):
+        if isinstance(other, pd.Series):
+            codes = _series_codes(other)
+        else:
+            codes = _to_int_codes(other)
+        if len(codes) != len(self._codes):
+            raise ValueError("lists of grid square codes differ in length (%d and %d)" % (len(self._codes), len(codes)))
+        lat0, long0 = _meshcode_to_center_array(self._codes, self._level)
+        lat1, long1 = _meshcode_to_center_array(codes, _levels_array(_code_lengths_array(codes)))
+        return pd.Series(_haversine_array(lat0, long0, lat1, long1), index=self._series.index)
+
+    def parent(self, level=None):
+        parent = np.zeros(len(self._codes), dtype=np.int64)
+        for current, sel in self._groups():
+            if level is None:
+                target = current - 1
+            else:
+                target = level
+            if target < 1 or target > current:
+                continue
+            parent[sel] = self._codes[sel] // _POW10[_MESH_LENGTHS[current-1]-_MESH_LENGTHS[target-1]]
+        return pd.Series(MeshcodeArray(parent), index=self._series.index)
+
+    def neighbors(self):
+        n = len(self._codes)
+        out = dict((name, np.zeros(n, dtype=np.int64)) for name in _NEIGHBOR_NAMES)
+        for level, sel in self._groups():
+            row, col = _meshcode_to_index_array(self._codes[sel], level)
+            for name, (dr, dc) in zip(_NEIGHBOR_NAMES, _NEIGHBOR_OFFSETS):
+                out[name][sel] = _index_to_meshcode_array(level, row+dr, col+dc)
+        return pd.DataFrame(dict((name, MeshcodeArray(out[name])) for name in _NEIGHBOR_NAMES),
+                            index=self._series.index)